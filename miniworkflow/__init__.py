@@ -1,13 +1,54 @@
+from array import array
+from collections import Counter, Mapping, OrderedDict, deque
+from copy import deepcopy
+from itertools import count
+import sys
+import threading
+import time
+
+
+class _NoLock(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *_):
+        pass
+
+
+_NO_LOCK = _NoLock()
+
+
 class TaskResult(object):
     COMPLETED = "completed"
     WAIT = "wait"
 
 
+def _slots_state(obj):
+    """
+    Pickle state of a slotted object, protocols below 2 included; attributes
+    of unslotted subclasses come along
+    """
+    state = dict(getattr(obj, '__dict__', {}))
+    for name in obj.__slots__:
+        if name != '__weakref__' and hasattr(obj, name):
+            state[name] = getattr(obj, name)
+    return state
+
+
+def _set_slots_state(obj, state):
+    for name, value in state.iteritems():
+        setattr(obj, name, value)
+
+
 class Transition(object):
-    def __init__(self, target_node, condition=None):
+    __slots__ = ('condition', 'target_node', 'source_node', 'delay', '__weakref__')
+
+    def __init__(self, target_node, condition=None, delay=None):
         self.condition = condition
         self.target_node = target_node
         self.source_node = None
+        # seconds between the source completing and the target being activated
+        self.delay = delay
 
     def inv_connect(self, node):
         self.source_node = node
@@ -20,6 +61,9 @@ class Transition(object):
     def eval(self, workflow, node):
         return self.condition is None or self.condition(workflow, node)
 
+    __getstate__ = _slots_state
+    __setstate__ = _set_slots_state
+
 
 class BaseVisitor(object):
     def __init__(self):
@@ -49,23 +93,96 @@ class BaseVisitor(object):
         pass
 
 
-class DotVisitor(BaseVisitor):
-    def print_it(self):
-        nodes = []
-        arcs = []
-        for n in self.visited_list:
-            if not isinstance(n, Node):
-                continue
-            nodes.append(n.get_digraph_node())
-            arcs.append(n.get_digraph_rels())
+class WorkflowSpec(object):
+    """
+    Immutable, compiled view of a workflow definition. The Node/Transition
+    graph is walked once and every instance created from the same spec
+    shares the resulting indexes: uuid -> node, uuid -> integer node id,
+    successor/predecessor adjacency by node id and in-degree per node id.
+    """
+
+    def __init__(self, start_node):
+        self.start_node = start_node
+        self.node_list = self.__walk(start_node)
+        self.node_ids = dict((n.uuid(), i) for i, n in enumerate(self.node_list))
+        self.nodes = dict((n.uuid(), n) for n in self.node_list)
+        self.successors = tuple(tuple(self.node_ids[t.target_node.uuid()] for t in n.out_transitions)
+                                for n in self.node_list)
+        self.predecessors = tuple(tuple(self.node_ids[t.source_node.uuid()] for t in n.in_transitions
+                                        if t.source_node.uuid() in self.node_ids)
+                                  for n in self.node_list)
+        self.in_degree = tuple(len(n.in_transitions) for n in self.node_list)
+        # top-level variable -> declarative conditions reading it, for memo invalidation
+        self.conditions_by_variable = {}
+        for n in self.node_list:
+            for t in n.out_transitions:
+                for root in getattr(t.condition, 'roots', ()):
+                    self.conditions_by_variable.setdefault(root, set()).add(t.condition)
+        self.__analysis = None
+
+    def get_analysis(self):
+        """
+        miniworkflow.analysis.SpecAnalysis of the graph, computed on first use
+        """
+        if self.__analysis is None:
+            from miniworkflow.analysis import SpecAnalysis
+            self.__analysis = SpecAnalysis(self)
+        return self.__analysis
+
+    analysis = property(get_analysis)
+
+    @staticmethod
+    def __walk(start_node):
+        """
+        The nodes in the order Node.accept visits them, with a worklist of
+        transition iterators instead of recursion, so the depth of the graph
+        is not bounded by the interpreter's stack
+        """
+        nodes = [start_node]
+        seen_nodes = set(nodes)
+        seen_transitions = set()
+        work = [iter(start_node.out_transitions)]
+        while work:
+            for transition in work[-1]:
+                if transition in seen_transitions:
+                    continue
+                seen_transitions.add(transition)
+                target = transition.target_node
+                if target not in seen_nodes:
+                    seen_nodes.add(target)
+                    nodes.append(target)
+                work.append(iter(target.out_transitions))
+                break
+            else:
+                work.pop()
+        return tuple(nodes)
+
+    def __len__(self):
+        return len(self.node_list)
+
+    def node_id(self, uuid):
+        return self.node_ids[uuid]
+
+    def node_by_id(self, node_id):
+        return self.node_list[node_id]
 
-        d = "digraph Test {"
-        d += " graph [rankdir = LR,ordering=out];\n"
-        d += " node [shape=record];\n"
-        d += "".join(nodes)
-        d += "".join(arcs)
-        d += "}"
-        return d
+
+class StateChange(object):
+    """
+    Primitive state transitions of a MiniWorkflow, as recorded in its journal
+    """
+    ACTIVATE = "a"
+    POP = "p"
+    WAIT = "w"
+    COMPLETE = "c"
+    VARIABLES = "v"
+    SCHEDULE = "s"
+    CANCEL = "x"
+
+
+class TimerKind(object):
+    TIMEOUT = "timeout"
+    ACTIVATE = "activate"
 
 
 class WorkflowEvent(object):
@@ -73,6 +190,7 @@ class WorkflowEvent(object):
     NODE_EXECUTE = "node_execute"
     NODE_COMPLETED = "node_completed"
     NODE_SET_ACTIVE = "activating"
+    VARIABLES_CHANGED = "variables_changed"
 
 
 class WorkflowObserver(object):
@@ -89,15 +207,224 @@ class WorkflowObserver(object):
     def subscribe(self, event, we):
         self.subscribers.setdefault(event, []).append(we)
 
+    def flush(self):
+        pass
+
+
+class NodeQueue(object):
+    """
+    Insertion ordered multiset of node uuids. Appending, popping the oldest
+    entry, membership tests and removing the oldest occurrence of a uuid
+    are all O(1), unlike the plain lists this replaces.
+    """
+
+    def __init__(self, uuids=()):
+        self.__entries = OrderedDict()
+        self.__positions = {}
+        self.__sequence = count()
+        for uuid in uuids:
+            self.append(uuid)
+
+    def append(self, uuid):
+        position = next(self.__sequence)
+        self.__entries[position] = uuid
+        self.__positions.setdefault(uuid, deque()).append(position)
+
+    def popleft(self):
+        position, uuid = self.__entries.popitem(last=False)
+        self.__forget(uuid)
+        return uuid
+
+    def remove(self, uuid):
+        try:
+            position = self.__forget(uuid)
+        except KeyError:
+            raise ValueError("%r is not in the queue" % (uuid,))
+        del self.__entries[position]
+
+    def count(self, uuid):
+        return len(self.__positions.get(uuid, ()))
+
+    def copy(self):
+        queue = NodeQueue.__new__(NodeQueue)
+        queue.__entries = OrderedDict(self.__entries)
+        queue.__positions = dict((uuid, deque(positions)) for uuid, positions in self.__positions.iteritems())
+        queue.__sequence = count(next(self.__sequence))
+        return queue
 
-def NodeIterator(workflow):
-    active = workflow.active_nodes[:]
-    while len(active) > 0:
-        for node_uuid in active:
-            node = workflow.nodes[node_uuid]
-            workflow.active_nodes.remove(node_uuid)
-            yield node
-        active = workflow.active_nodes[:]
+    def __forget(self, uuid):
+        positions = self.__positions[uuid]
+        position = positions.popleft()
+        if not positions:
+            del self.__positions[uuid]
+        return position
+
+    def __contains__(self, uuid):
+        return uuid in self.__positions
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __iter__(self):
+        return self.__entries.itervalues()
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+
+class NodeTrace(object):
+    """
+    Append-only trace of node uuids, stored as the spec's integer node ids in
+    an array. `limit` bounds what is retained: None keeps every entry, N keeps
+    the last N in a ring buffer and 0 keeps none, leaving only the counters
+    (`total` here and MiniWorkflow.execution_counts). A restored trace is
+    given the `total` it was saved with, counting the entries dropped before.
+    """
+
+    def __init__(self, spec, uuids=(), limit=None, total=None):
+        self.spec = spec
+        self.limit = limit
+        self.total = 0
+        self.__ids = array('i')
+        self.__start = 0
+        for uuid in uuids:
+            self.append(uuid)
+        if total is not None:
+            self.total = max(total, self.total)
+
+    def append(self, uuid):
+        node_id = self.spec.node_ids[uuid]
+        self.total += 1
+        if self.limit is None or len(self.__ids) < self.limit:
+            self.__ids.append(node_id)
+        elif self.limit:
+            self.__ids[self.__start] = node_id
+            self.__start = (self.__start + 1) % self.limit
+
+    def node_ids(self):
+        return self.__ids[self.__start:] + self.__ids[:self.__start]
+
+    def copy(self):
+        trace = NodeTrace.__new__(NodeTrace)
+        trace.spec = self.spec
+        trace.limit = self.limit
+        trace.total = self.total
+        trace.__ids = array('i', self.__ids)
+        trace.__start = self.__start
+        return trace
+
+    def count(self, uuid):
+        node_id = self.spec.node_ids.get(uuid)
+        return 0 if node_id is None else self.__ids.count(node_id)
+
+    def __iter__(self):
+        node_list = self.spec.node_list
+        for node_id in self.node_ids():
+            yield node_list[node_id].uuid()
+
+    def __len__(self):
+        return len(self.__ids)
+
+    def __getitem__(self, index):
+        # positions are mapped into the ring buffer, only the selected ids become uuids
+        ids = self.__ids
+        n = len(ids)
+        node_list = self.spec.node_list
+        if isinstance(index, slice):
+            return [node_list[ids[(self.__start + i) % n]].uuid() for i in xrange(*index.indices(n))]
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("trace index out of range")
+        return node_list[ids[(self.__start + index) % n]].uuid()
+
+    def __contains__(self, uuid):
+        return self.count(uuid) > 0
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+
+class WorkflowVariables(Mapping):
+    """
+    Read-only mapping over the workflow variables. Only the engine writes
+    them, through _update(); callers go through
+    MiniWorkflow.update_workflow_variables so changes are journaled and
+    memoized conditions invalidated.
+    Values are deep-copied on the way in and never mutated in place after,
+    so snapshot() can share the current dict: only the next update copies it,
+    and only its top level. The entries changed since the last drain_delta()
+    are kept for observers.
+    """
+
+    def __init__(self, variables=None):
+        self.__variables = deepcopy(dict(variables or {}))
+        self.__shared = False
+        self.__delta = {}
+
+    def __getitem__(self, key):
+        return self.__variables[key]
+
+    def __iter__(self):
+        return iter(self.__variables)
+
+    def __len__(self):
+        return len(self.__variables)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.__variables)
+
+    def changes(self, update):
+        """
+        The entries of `update` that differ from the current values
+        """
+        variables = self.__variables
+        return dict((key, value) for key, value in update.iteritems()
+                    if key not in variables or variables[key] != value)
+
+    def _update(self, update):
+        if not update:
+            return
+        update = deepcopy(update)
+        if self.__shared:
+            self.__variables = dict(self.__variables)
+            self.__shared = False
+        self.__variables.update(update)
+        self.__delta.update(update)
+
+    def snapshot(self):
+        """
+        The variables as a plain dict, shared with this container until its
+        next update; treat it as read-only
+        """
+        self.__shared = True
+        return self.__variables
+
+    def drain_delta(self):
+        delta, self.__delta = self.__delta, {}
+        return delta
+
+    def copy(self):
+        """
+        Another container over the same values, without the pending delta;
+        whichever is updated first copies the dict
+        """
+        other = WorkflowVariables()
+        other.__variables = self.snapshot()
+        other.__shared = True
+        return other
 
 
 def infinite():
@@ -105,60 +432,239 @@ def infinite():
         yield
 
 
-class MiniWorkflow(BaseVisitor):
-    def collect_nodes(self, start_node):
-        start_node.accept(self)
+class MiniWorkflow(object):
+    __trace_keys = ['activation_trace', 'waiting_trace', 'executed_trace']
+    # miniworkflow.instrumentation.Instrumentation collecting timings, if any
+    instrumentation = None
 
-    def __init__(self, start_node, workflow_variables=None):
-        super(MiniWorkflow, self).__init__()
-        self.workflow_variables = workflow_variables or {}
+    def __init__(self, start_node, workflow_variables=None, spec=None, trace_limit=None, clock=time.time):
+        self.__spec = spec
+        self.workflow_variables = WorkflowVariables(workflow_variables)
         self.start_node = start_node
-        self.activation_trace = []
-        self.waiting_trace = []
-        self.waiting_list = []
-        self.active_nodes = [start_node.uuid()]
-        self.executed_trace = []
-        self.node_iterator = NodeIterator(self)
+        self.trace_limit = trace_limit
+        self.activation_trace = NodeTrace(self.spec, limit=trace_limit)
+        self.waiting_trace = NodeTrace(self.spec, limit=trace_limit)
+        self.waiting_list = NodeQueue()
+        self.active_nodes = NodeQueue([start_node.uuid()])
+        self.executed_trace = NodeTrace(self.spec, limit=trace_limit)
+        self.execution_counts = Counter()
+        self.arrivals = Counter()
+        self.clock = clock
+        self.timers = {}
+        # uuid -> times its pending waits started, oldest first
+        self.waiting_since = {}
+        self.condition_cache = {}
+        self.journal = None
+        self.__mutex = _NO_LOCK
         self.observer = WorkflowObserver()
-        self.__nodes = None
-        self.__state_keys = ['workflow_variables', 'activation_trace', 'waiting_trace', 'executed_trace',
-                             'waiting_list',
-                             'active_nodes']
+
+    def get_spec(self):
+        if self.__spec is None:
+            self.__spec = WorkflowSpec(self.start_node)
+        return self.__spec
+
+    spec = property(get_spec)
 
     def get_node(self):
-        if self.__nodes is None:
-            self.__nodes = {}
-            self.collect_nodes(self.start_node)
-        return self.__nodes
+        return self.spec.nodes
 
     nodes = property(get_node)
 
     def get_state(self):
-        return dict([(k, getattr(self, k)) for k in
-                     self.__state_keys])
+        """
+        Detached copy of the instance state; later steps don't leak into it.
+        The variables are a copy-on-write snapshot, don't modify them.
+        """
+        self.observer.flush()
+        state = dict([(k, list(getattr(self, k))) for k in
+                      self.__trace_keys])
+        state['trace_totals'] = dict((k, getattr(self, k).total) for k in self.__trace_keys)
+        state['waiting_list'] = list(self.waiting_list)
+        state['active_nodes'] = list(self.active_nodes)
+        state['execution_counts'] = dict(self.execution_counts)
+        state['timers'] = [[kind, uuid, deadline] for (kind, uuid), deadline in self.timers.iteritems()]
+        state['waiting_since'] = dict((uuid, list(times)) for uuid, times in self.waiting_since.iteritems())
+        state['workflow_variables'] = self.workflow_variables.snapshot()
+        return state
 
     def set_state(self, s):
-        for k in self.__state_keys:
-            setattr(self, k, s[k])
-
-    def _visit_node(self, node):
-        self.__nodes[node.uuid()] = node
+        totals = s.get('trace_totals', {})
+        for k in self.__trace_keys:
+            setattr(self, k, NodeTrace(self.spec, s[k], self.trace_limit, totals.get(k)))
+        self.workflow_variables = WorkflowVariables(s['workflow_variables'])
+        self.waiting_list = NodeQueue(s['waiting_list'])
+        self.active_nodes = NodeQueue(s['active_nodes'])
+        # states saved before execution_counts existed only have the full trace
+        self.execution_counts = Counter(s.get('execution_counts') or s['executed_trace'])
+        self.timers = dict(((kind, uuid), deadline) for kind, uuid, deadline in s.get('timers', []))
+        self.waiting_since = dict((uuid, list(times)) for uuid, times in s.get('waiting_since', {}).iteritems())
+        self.condition_cache = {}
+        self.__rebuild_arrivals()
+
+    def clone(self):
+        """
+        Independent copy of the instance state, without the observer
+        subscriptions and the journal
+        """
+        # skips __init__: everything it would build is replaced below
+        w = MiniWorkflow.__new__(MiniWorkflow)
+        w.__spec = self.spec
+        w.__mutex = _NO_LOCK
+        w.start_node = self.start_node
+        w.trace_limit = self.trace_limit
+        w.clock = self.clock
+        w.journal = None
+        w.observer = WorkflowObserver()
+        w.instrumentation = self.instrumentation
+        for k in self.__trace_keys:
+            setattr(w, k, getattr(self, k).copy())
+        w.workflow_variables = self.workflow_variables.copy()
+        w.waiting_list = self.waiting_list.copy()
+        w.active_nodes = self.active_nodes.copy()
+        w.execution_counts = Counter(self.execution_counts)
+        w.arrivals = Counter(self.arrivals)
+        w.timers = dict(self.timers)
+        w.waiting_since = dict((uuid, list(times)) for uuid, times in self.waiting_since.iteritems())
+        w.condition_cache = dict(self.condition_cache)
+        return w
 
     def update_workflow_variables(self, update):
-        self.workflow_variables.update(update)
+        # only the entries that actually change are journaled and observed
+        with self.__mutex:
+            changes = self.workflow_variables.changes(update)
+            if changes:
+                self.__change(StateChange.VARIABLES, changes)
+
+    def publish_variables(self):
+        """
+        Notify VARIABLES_CHANGED with the variables changed since the last call
+        """
+        delta = self.workflow_variables.drain_delta()
+        if delta:
+            self.observer.notify(WorkflowEvent.VARIABLES_CHANGED, delta)
 
     def has_executed(self, a_node):
-        return (a_node.uuid() in self.executed_trace and
-                not a_node.uuid() in self.waiting_list and
-                not a_node.uuid() in self.active_nodes)
-
+        uuid = a_node.uuid()
+        return (uuid in self.execution_counts and
+                not uuid in self.waiting_list and
+                not uuid in self.active_nodes)
+
+    def satisfied_arcs(self, a_node):
+        """
+        Number of in-transitions of a_node whose source node has executed,
+        kept up to date incrementally so joins are checked in O(1)
+        """
+        return self.arrivals.get(a_node.uuid(), 0)
+
+    def __signal_arrivals(self, node, had_executed):
+        if self.has_executed(node) == had_executed:
+            return
+        delta = -1 if had_executed else 1
+        for transition in node.out_transitions:
+            target = transition.target_node.uuid()
+            self.arrivals[target] += delta
+            if not self.arrivals[target]:
+                del self.arrivals[target]
+
+    def __rebuild_arrivals(self):
+        self.arrivals = Counter()
+        for uuid in self.execution_counts:
+            node = self.nodes[uuid]
+            if self.has_executed(node):
+                for transition in node.out_transitions:
+                    self.arrivals[transition.target_node.uuid()] += 1
+
+    def __push_active(self, uuid):
+        node = self.nodes[uuid]
+        had_executed = self.has_executed(node)
+        self.activation_trace.append(uuid)
+        self.active_nodes.append(uuid)
+        self.__signal_arrivals(node, had_executed)
+
+    def __pop_active(self, uuid):
+        self.active_nodes.remove(uuid)
+        # an active node can't count as executed, so only the pop may flip it
+        self.__signal_arrivals(self.nodes[uuid], False)
+
+    def __push_waiting(self, argument):
+        # journals written before wait start times were recorded only have the uuid
+        uuid, started = argument if isinstance(argument, list) else (argument, None)
+        self.waiting_since.setdefault(uuid, []).append(started)
+        node = self.nodes[uuid]
+        had_executed = self.has_executed(node)
+        self.waiting_trace.append(uuid)
+        self.waiting_list.append(uuid)
+        self.__signal_arrivals(node, had_executed)
+
+    def __mark_executed(self, uuid):
+        node = self.nodes[uuid]
+        had_executed = self.has_executed(node)
+        if uuid in self.waiting_list:
+            self.waiting_list.remove(uuid)
+            times = self.waiting_since.get(uuid)
+            if times:
+                times.pop(0)
+                if not times:
+                    del self.waiting_since[uuid]
+        self.executed_trace.append(uuid)
+        self.execution_counts[uuid] += 1
+        self.__signal_arrivals(node, had_executed)
+
+    def __merge_variables(self, update):
+        self.workflow_variables._update(update)
+        conditions_by_variable = self.spec.conditions_by_variable
+        for key in update:
+            for condition in conditions_by_variable.get(key, ()):
+                self.condition_cache.pop(condition, None)
+
+    def __schedule_timer(self, timer):
+        kind, uuid, deadline = timer
+        self.timers[(kind, uuid)] = deadline
+
+    def __cancel_timer(self, timer):
+        kind, uuid = timer
+        self.timers.pop((kind, uuid), None)
+
+    __changes = {
+        StateChange.ACTIVATE: __push_active,
+        StateChange.POP: __pop_active,
+        StateChange.WAIT: __push_waiting,
+        StateChange.COMPLETE: __mark_executed,
+        StateChange.VARIABLES: __merge_variables,
+        StateChange.SCHEDULE: __schedule_timer,
+        StateChange.CANCEL: __cancel_timer
+    }
+
+    def __change(self, change, argument):
+        with self.__mutex:
+            self.__changes[change](self, argument)
+            if self.journal is not None:
+                self.journal.append([change, deepcopy(argument)])
+
+    def replay(self, changes):
+        """
+        Re-apply journaled state changes without running decompositions,
+        evaluating transitions or notifying observers
+        """
+        for change, argument in changes:
+            self.__changes[change](self, argument)
+        self.workflow_variables.drain_delta()
+
+    def pop_active(self, uuid=None):
+        if uuid is None:
+            uuid = next(iter(self.active_nodes))
+        self.__change(StateChange.POP, uuid)
+        return uuid
 
     def fetch(self, ):
-        return self.node_iterator.next()
+        if len(self.active_nodes) == 0:
+            raise StopIteration
+        return self.nodes[self.pop_active()]
 
     def step(self, ):
         node = self.fetch()
         self.execute(node)
+        return node
 
     def __run_iterator(self, max_steps):
         if max_steps:
@@ -168,37 +674,191 @@ class MiniWorkflow(BaseVisitor):
         return iterator
 
     def run(self, max_steps=None):
+        """
+        Step until no node is active, `max_steps` are taken or the instance
+        is stuck spinning in a loop it can't leave
+        """
         for _ in self.__run_iterator(max_steps):
             try:
-                self.step()
+                node = self.step()
             except StopIteration:
                 break
+            if self.stuck_after(node):
+                break
+
+    def stuck_after(self, *nodes):
+        """
+        Whether the instance is stuck once `nodes` have executed; only
+        checked when one of them is in a spinning loop. Every runner stops
+        on it.
+        """
+        spins = self.spec.analysis.spins
+        node_ids = self.spec.node_ids
+        return any(spins[node_ids[node.uuid()]] for node in nodes) and self.is_stuck()
+
+    def is_finished(self):
+        """
+        Nothing active, waiting or scheduled is left. A finished instance
+        may still be deadlocked, see is_deadlocked()
+        """
+        return not self.active_nodes and not self.waiting_list and not self.timers
+
+    def is_stuck(self):
+        """
+        Whether the instance has active nodes but can never finish: every
+        one of them spins in a closed loop it can't leave. Pending waits and
+        timers may change that, so an instance with some is never stuck. A
+        stuck instance is never finished.
+        """
+        if not self.active_nodes or self.waiting_list or self.timers:
+            return False
+        spins = self.spec.analysis.spins
+        node_ids = self.spec.node_ids
+        return all(spins[node_ids[uuid]] for uuid in self.active_nodes)
+
+    def is_deadlocked(self):
+        """
+        Whether the instance finished with a join still missing arrivals
+        that can no longer come
+        """
+        return self.is_finished() and any(0 < self.arrivals[uuid] < required
+                                          for uuid, required in self.spec.analysis.joins)
+
+    def run_parallel(self, pool, max_steps=None, deterministic=True):
+        """
+        Like run(), but the decompositions of every node active at the same
+        time run concurrently on `pool` (e.g. a multiprocessing.pool.ThreadPool).
+        Their results are applied one at a time under the state lock: in
+        activation order when `deterministic`, which reproduces run()'s trace
+        as long as concurrent decompositions don't depend on each other, or
+        in completion order otherwise.
+        """
+        self.__mutex = threading.RLock()
+        try:
+            steps = 0
+            while len(self.active_nodes) > 0 and (max_steps is None or steps < max_steps):
+                wave = [self.nodes[uuid] for uuid in self.active_nodes]
+                if max_steps is not None:
+                    wave = wave[:max_steps - steps]
+                steps += len(wave)
+                # announced before submitting, as run() does before executing; each node stays active
+                # until its own result is applied, so joins don't count running nodes as done
+                for node in wave:
+                    self.observer.notify(WorkflowEvent.NODE_EXECUTE, node)
+                if deterministic:
+                    results = enumerate(pool.map(lambda n: n.run_decomposition(self), wave))
+                else:
+                    results = pool.imap_unordered(lambda item: (item[0], item[1].run_decomposition(self)),
+                                                 enumerate(wave))
+                for i, response in results:
+                    node = wave[i]
+                    with self.__mutex:
+                        self.pop_active(node.uuid())
+                        node.apply_result(self, response)
+                if self.stuck_after(*wave):
+                    break
+        finally:
+            self.__mutex = _NO_LOCK
+
+    def run_async(self, max_steps=None, loop=None):
+        """
+        Like run(), on an asyncio event loop; see miniworkflow.aio
+        """
+        from miniworkflow.aio import run_async
+        return run_async(self, max_steps, loop)
 
     def activate(self, a_node):
+        if self.instrumentation is not None:
+            self.instrumentation.activated(self, a_node)
         self.observer.notify(WorkflowEvent.NODE_SET_ACTIVE, a_node)
-        self.activation_trace.append(a_node.uuid())
-        self.active_nodes.append(a_node.uuid())
+        self.__change(StateChange.ACTIVATE, a_node.uuid())
 
     def waiting(self, node):
-        self.waiting_trace.append(node.uuid())
-        self.waiting_list.append(node.uuid())
+        uuid = node.uuid()
+        self.__change(StateChange.WAIT, [uuid, self.clock()])
+        if node.timeout is not None:
+            self.__change(StateChange.SCHEDULE, [TimerKind.TIMEOUT, uuid, self.clock() + node.timeout])
+        if self.instrumentation is not None:
+            self.instrumentation.waiting(self, node)
+        self.observer.notify(WorkflowEvent.NODE_WAIT, node)
+        self.publish_variables()
+
+    def wait_started(self, uuid):
+        """
+        When the oldest pending wait on `uuid` started, by the instance's
+        clock; None if it isn't waiting or the start wasn't recorded
+        """
+        times = self.waiting_since.get(uuid)
+        return times[0] if times else None
 
     def completed(self, node):
-        if node.uuid() in self.waiting_list:
-            self.waiting_list.remove(node.uuid())
-        self.executed_trace.append(node.uuid())
+        uuid = node.uuid()
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            wait_started = self.wait_started(uuid) if uuid in self.waiting_list else None
+        self.__change(StateChange.COMPLETE, uuid)
+        if self.timers and (TimerKind.TIMEOUT, uuid) in self.timers and uuid not in self.waiting_list:
+            self.__change(StateChange.CANCEL, [TimerKind.TIMEOUT, uuid])
+        if instrumentation is not None:
+            instrumentation.completed(self, node)
+            if wait_started is not None:
+                instrumentation.observe('node_waiting_seconds', uuid, self.clock() - wait_started)
+            started = instrumentation.clock()
+        self.observer.notify(WorkflowEvent.NODE_COMPLETED, node)
+        self.publish_variables()
         # signal transitions
         for transition in node.out_transitions:
-            if transition.eval(self, node) and transition.target_node.can_execute_in(self):
+            if not transition.eval(self, node):
+                continue
+            if instrumentation is not None:
+                instrumentation.count('transitions_taken_total', (node.uuid(), transition.target_node.uuid()))
+            if transition.delay is not None:
+                self.__delay_activation(transition)
+            elif transition.target_node.can_execute_in(self):
                 self.activate(transition.target_node)
+        if instrumentation is not None:
+            instrumentation.since('node_transitions_seconds', node.uuid(), started)
+
+    def __delay_activation(self, transition):
+        # an activation already pending for the same node absorbs this one
+        uuid = transition.target_node.uuid()
+        if (TimerKind.ACTIVATE, uuid) not in self.timers:
+            self.__change(StateChange.SCHEDULE, [TimerKind.ACTIVATE, uuid, self.clock() + transition.delay])
+
+    def next_deadline(self):
+        return min(self.timers.itervalues()) if self.timers else None
+
+    def fire_timers(self, now=None):
+        """
+        Act on every timer due at `now`: waiting nodes whose timeout expired
+        are timed out and delayed activations take place. Call run() next.
+        Returns the number of timers fired.
+        """
+        if now is None:
+            now = self.clock()
+        due = sorted((deadline, kind, uuid) for (kind, uuid), deadline in self.timers.iteritems()
+                     if deadline <= now)
+        for _, kind, uuid in due:
+            self.__change(StateChange.CANCEL, [kind, uuid])
+            node = self.nodes[uuid]
+            if kind == TimerKind.TIMEOUT:
+                if uuid in self.waiting_list:
+                    node.time_out(self)
+            elif node.can_execute_in(self):
+                self.activate(node)
+        return len(due)
 
     def execute(self, node):
         self.observer.notify(WorkflowEvent.NODE_EXECUTE, node)
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return node.execute(self)
+        started = instrumentation.clock()
         node.execute(self)
+        instrumentation.since('node_execute_seconds', node.uuid(), started)
 
     def complete_by_uuid(self, uuid, data):
         self.nodes[uuid].complete(self, data)
-        self.node_iterator = NodeIterator(self)
 
 
 def to_dot_record(l):
@@ -209,12 +869,21 @@ def to_dot_record(l):
 
 
 class Node(object):
-    def __init__(self, description, activation_policy=None):
+    __slots__ = ('activation_policy', 'in_transitions', 'out_transitions', 'description', 'decomposition_factory',
+                 'timeout', '__weakref__')
+    TIMED_OUT = {"timed_out": True}
+
+    def __init__(self, description, activation_policy=None, timeout=None):
         self.activation_policy = activation_policy or AlwaysActivatePolicy()
         self.in_transitions = []
         self.out_transitions = []
         self.description = description
         self.decomposition_factory = None
+        # seconds this node may stay waiting before it is timed out
+        self.timeout = timeout
+
+    __getstate__ = _slots_state
+    __setstate__ = _set_slots_state
 
     def get_digraph_node(self):
         label = self.activation_policy.decorate_digraph_node([self.description])
@@ -243,15 +912,20 @@ class Node(object):
         transition.inv_connect(self)
 
     def execute(self, workflow):
+        self.apply_result(workflow, self.run_decomposition(workflow))
+
+    def run_decomposition(self, workflow):
         if self.decomposition_factory:
-            response = self.decomposition_factory.get_instance().execute(self, workflow)
+            return self.decomposition_factory.get_instance().execute(self, workflow)
+        return TaskResult.COMPLETED
+
+    def apply_result(self, workflow, response):
+        if response == TaskResult.COMPLETED:
+            workflow.completed(self)
+        elif response == TaskResult.WAIT:
+            workflow.waiting(self)
         else:
-            response = TaskResult.COMPLETED
-        {
-            TaskResult.COMPLETED: workflow.completed,
-            TaskResult.WAIT: workflow.waiting
-        }[response](self)
-
+            raise KeyError(response)
 
     def set_decomposition_factory(self, decomposition_factory):
         self.decomposition_factory = decomposition_factory
@@ -266,10 +940,20 @@ class Node(object):
     def process_async_completion(self, workflow, data):
         pass
 
-    def write_graph(self, g):
-        visitor = DotVisitor()
-        self.accept(visitor)
-        g.write(visitor.print_it())
+    def time_out(self, workflow):
+        """
+        Called when the node's timeout expires while waiting; by default it
+        completes the node with Node.TIMED_OUT as the completion data
+        """
+        self.complete(workflow, self.TIMED_OUT)
+
+    def write_graph(self, g, **options):
+        """
+        Stream the graph reachable from this node to `g` in DOT; see
+        miniworkflow.graph.DotWriter for the options
+        """
+        from miniworkflow.graph import DotWriter
+        DotWriter(g, **options).write(self)
 
 
 class AndActivationPolicy(object):
@@ -278,12 +962,41 @@ class AndActivationPolicy(object):
     """
 
     def can_activate(self, node, workflow):
-        return all(workflow.has_executed(t.source_node) for t in node.in_transitions)
+        return workflow.satisfied_arcs(node) == len(node.in_transitions)
 
     def decorate_digraph_node(self, label_list):
         return ["AND"] + label_list
 
 
+class QuorumActivationPolicy(object):
+    """
+    N-of-M join: activate as soon as `required` of the previous nodes
+    have executed. Later arrivals on the same join are ignored until a
+    loop resets it.
+    """
+
+    def __init__(self, required):
+        self.required = required
+
+    def can_activate(self, node, workflow):
+        return workflow.satisfied_arcs(node) == self.required
+
+    def decorate_digraph_node(self, label_list):
+        return ["%d OF N" % self.required] + label_list
+
+
+class DiscriminatorActivationPolicy(QuorumActivationPolicy):
+    """
+    Activate on the first previous node to execute, ignore the rest
+    """
+
+    def __init__(self):
+        super(DiscriminatorActivationPolicy, self).__init__(1)
+
+    def decorate_digraph_node(self, label_list):
+        return ["DISCRIMINATOR"] + label_list
+
+
 class AlwaysActivatePolicy(object):
     def can_activate(self, *_):
         return True
@@ -297,42 +1010,233 @@ class WorkflowNotFound(Exception):
 
 
 class EventProcessor(object):
-    def __init__(self, workflow_base, workflow_factory):
+    def __init__(self, workflow_base, workflow_factory, dedup_index=None, timers=None, instrumentation=None):
         self.workflow_factory = workflow_factory
         self.workflow_base = workflow_base
+        self.dedup_index = dedup_index
+        self.timers = timers
+        self.instrumentation = instrumentation
+        self.duplicates = 0
+        self.in_flight = {}
 
     def process(self, event):
+        if self.instrumentation is None:
+            return self.__process(event)
+        started = self.instrumentation.clock()
+        try:
+            self.__process(event)
+        finally:
+            self.instrumentation.since('event_process_seconds', event.__class__.__name__, started)
+
+    def __process(self, event):
+        if self.is_duplicate(event):
+            return
         workflow_id = event.get_workflow_id()
+        workflow_instance = self.__load(workflow_id)
+        event.apply(workflow_instance)
+        self.save(workflow_id, workflow_instance)
+        self.remember(event)
+        self.__forget_if_finished(workflow_id, workflow_instance)
+
+    def save(self, workflow_id, workflow_instance):
+        self.workflow_base.save_workflow(workflow_id, workflow_instance)
+        if self.timers is not None:
+            self.timers.track(workflow_id, workflow_instance.timers)
+
+    def fire_timers(self):
+        """
+        Load, advance and save only the workflows with an expired timer.
+        Returns their ids. Timers of workflows that are no longer in the store
+        are dropped; a workflow that fails is queued again for the next call
+        and, once the others are done, the first failure is raised.
+        """
+        if self.timers is None:
+            return []
+        now = self.timers.clock()
+        fired = []
+        failure = None
+        for workflow_id in self.timers.pop_due(now):
+            try:
+                workflow_instance = self.workflow_base.get_workflow(workflow_id)
+                workflow_instance.fire_timers(now)
+                workflow_instance.run()
+                self.save(workflow_id, workflow_instance)
+                self.__forget_if_finished(workflow_id, workflow_instance)
+                fired.append(workflow_id)
+            except WorkflowNotFound:
+                self.timers.track(workflow_id, {})
+            except Exception:
+                self.timers.retry(workflow_id)
+                if failure is None:
+                    failure = sys.exc_info()
+        if failure is not None:
+            raise failure[0], failure[1], failure[2]
+        return fired
+
+    def complete_waiting(self, node_uuid, data, event_id=None):
+        """
+        Complete `node_uuid` in every workflow of the store waiting on it,
+        through the store's bulk complete_waiting, then track the timers of
+        the advanced instances. With an `event_id`, workflows that already
+        saw it are skipped and the others remember it, so a redelivered
+        broadcast is applied once. Returns the ids of the completed workflows.
+        """
+        dedup = self.dedup_index is not None and event_id is not None
+
+        def skip(workflow_id):
+            if dedup and self.dedup_index.seen(workflow_id, event_id):
+                self.duplicates += 1
+                return True
+            return False
+
+        completed = self.workflow_base.complete_waiting(node_uuid, data, skip)
+        for workflow_id, workflow_instance in completed.iteritems():
+            if self.timers is not None:
+                self.timers.track(workflow_id, workflow_instance.timers)
+            if dedup:
+                self.dedup_index.add(workflow_id, event_id)
+            self.__forget_if_finished(workflow_id, workflow_instance)
+        return list(completed)
+
+    def is_duplicate(self, event):
+        """
+        Whether `event` was already applied, according to the dedup index
+        """
+        event_id = getattr(event, 'event_id', None)
+        if self.dedup_index is None or event_id is None:
+            return False
+        if self.dedup_index.seen(event.get_workflow_id(), event_id):
+            self.duplicates += 1
+            return True
+        return False
+
+    def remember(self, event):
+        event_id = getattr(event, 'event_id', None)
+        if self.dedup_index is not None and event_id is not None:
+            self.dedup_index.add(event.get_workflow_id(), event_id)
+
+    def __forget_if_finished(self, workflow_id, workflow_instance):
+        # no event can advance a finished instance, so its ids are dead weight
+        if self.dedup_index is not None and workflow_instance.is_finished():
+            self.dedup_index.forget(workflow_id)
+
+    def process_batch(self, events):
+        """
+        Group events by workflow id: each instance is loaded (or created) and
+        saved once, with its events applied in between in arrival order, so
+        the resulting state is the one sequential processing would produce
+        """
+        by_workflow = OrderedDict()
+        for event in events:
+            by_workflow.setdefault(event.get_workflow_id(), []).append(event)
+        for workflow_id, workflow_events in by_workflow.iteritems():
+            workflow_events = [e for e in workflow_events if not self.is_duplicate(e)]
+            if not workflow_events:
+                continue
+            workflow_instance = self.__load(workflow_id)
+            applied = []
+            applied_ids = set()
+            for event in workflow_events:
+                event_id = getattr(event, 'event_id', None)
+                if event_id is not None and event_id in applied_ids:
+                    self.duplicates += 1
+                    continue
+                event.apply(workflow_instance)
+                applied.append(event)
+                applied_ids.add(event_id)
+            self.save(workflow_id, workflow_instance)
+            # only once saved, so a failed save can be retried with the same events
+            for event in applied:
+                self.remember(event)
+            self.__forget_if_finished(workflow_id, workflow_instance)
+
+    def create_workflows(self, workflow_ids, share_prefix=True):
+        """
+        Create, advance and add an instance for each id in one pass; see
+        WorkflowFactory.create_instances
+        """
+        workflow_ids = list(workflow_ids)
+        for workflow_id, workflow_instance in zip(workflow_ids, self.workflow_factory.create_instances(
+                len(workflow_ids), share_prefix)):
+            self.workflow_base.add_workflow(workflow_id, workflow_instance)
+            if self.timers is not None:
+                self.timers.track(workflow_id, workflow_instance.timers)
+
+    def __load(self, workflow_id):
         try:
-            workflow_instance = self.workflow_base.get_workflow(workflow_id)
+            return self.workflow_base.get_workflow(workflow_id)
         except WorkflowNotFound:
             workflow_instance = self.workflow_factory.create_instance()
             workflow_instance.run()
             self.workflow_base.add_workflow(workflow_id, workflow_instance)
+            return workflow_instance
 
-        event.apply(workflow_instance)
+    def process_async(self, event, loop=None):
+        """
+        Like process(), on an asyncio event loop; see miniworkflow.aio
+        """
+        from miniworkflow.aio import process_async
+        return process_async(self, event, loop)
 
 
 class EmailReceivedEvent(object):
-    def __init__(self, workflow_id, uuid):
+    def __init__(self, workflow_id, uuid, event_id=None):
         self.workflow_id = workflow_id
         self.uuid = uuid
+        # e.g. the Message-ID of the email; lets redeliveries be detected
+        self.event_id = event_id
 
     def get_workflow_id(self):
         # let' s assume for now workflow_id is == to some value in the email
         return self.workflow_id
 
-    def apply(self, workflow):
+    def complete(self, workflow):
         workflow.complete_by_uuid(self.uuid, {"os_list": [(123, 'base'), (234, 'base2')]})
+
+    def apply(self, workflow):
+        self.complete(workflow)
         workflow.run()
 
 
 class WorkflowFactory(object):
-    def __init__(self, spec):
+    def __init__(self, spec, trace_limit=None, clock=time.time, instrumentation=None):
+        if not isinstance(spec, WorkflowSpec):
+            spec = WorkflowSpec(spec)
         self.spec = spec
+        self.trace_limit = trace_limit
+        self.clock = clock
+        self.instrumentation = instrumentation
 
     def create_instance(self):
-        return MiniWorkflow(self.spec)
+        w = MiniWorkflow(self.spec.start_node, spec=self.spec, trace_limit=self.trace_limit, clock=self.clock)
+        if self.instrumentation is not None:
+            w.instrumentation = self.instrumentation
+        return w
+
+    def create_instances(self, n, share_prefix=True):
+        """
+        `n` new instances, each run() up to its first wait point. With
+        `share_prefix` the run happens once and the other instances are
+        cloned from it, so decompositions on the way execute once for all
+        of them: only share it when they have no per-instance side effects.
+        """
+        if n <= 0:
+            return []
+        if not share_prefix:
+            instances = [self.create_instance() for _ in xrange(n)]
+            for w in instances:
+                w.run()
+            return instances
+        prototype = self.create_instance()
+        prototype.run()
+        return [prototype] + [prototype.clone() for _ in xrange(n - 1)]
+
+    def create_cohort(self, size, workflow_variables=None):
+        """
+        `size` instances stepped together; see miniworkflow.cohort
+        """
+        from miniworkflow.cohort import Cohort
+        return Cohort(self.spec, size, workflow_variables)
 
 
 class WaitForExternalEvent(object):
@@ -0,0 +1,156 @@
+"""
+Event loop driven execution for decompositions that do I/O.
+
+An asynchronous decomposition's execute(node, workflow) returns an awaitable
+(a coroutine from an `async def execute`, or a Future) that resolves to a
+TaskResult instead of returning the TaskResult itself. While it is pending the
+loop is free to step other workflows, so thousands of instances can have
+outstanding external calls on a single thread. Synchronous decompositions keep
+working unchanged. Uses asyncio, or trollius on Python 2.
+"""
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from miniworkflow import TaskResult, WorkflowEvent, WorkflowNotFound
+
+
+def _is_task_result(response):
+    return response in (TaskResult.COMPLETED, TaskResult.WAIT)
+
+
+def _copy_outcome(source, target):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _then(future, callback, loop):
+    """
+    Future of callback(future's result); callback may itself return a future
+    """
+    chained = asyncio.Future(loop=loop)
+
+    def on_done(f):
+        if f.cancelled() or f.exception() is not None:
+            return _copy_outcome(f, chained)
+        try:
+            value = callback(f.result())
+        except Exception as e:
+            return chained.set_exception(e)
+        if isinstance(value, asyncio.Future):
+            value.add_done_callback(lambda v: _copy_outcome(v, chained))
+        else:
+            chained.set_result(value)
+
+    future.add_done_callback(on_done)
+    return chained
+
+
+def _then_always(future, loop):
+    settled = asyncio.Future(loop=loop)
+    future.add_done_callback(lambda _: settled.done() or settled.set_result(None))
+    return settled
+
+
+def _resolved(value, loop):
+    future = asyncio.Future(loop=loop)
+    future.set_result(value)
+    return future
+
+
+def run_async(workflow, max_steps=None, loop=None):
+    """
+    Step `workflow` like MiniWorkflow.run, awaiting asynchronous decompositions
+    on `loop`. Returns a future resolved with the workflow once no active nodes
+    are left, `max_steps` nodes were executed or it is stuck in a loop.
+    """
+    loop = loop or asyncio.get_event_loop()
+    done = asyncio.Future(loop=loop)
+    budget = [max_steps]
+
+    def advance():
+        try:
+            while len(workflow.active_nodes) > 0 and budget[0] != 0:
+                if budget[0] is not None:
+                    budget[0] -= 1
+                node = workflow.nodes[workflow.pop_active()]
+                workflow.observer.notify(WorkflowEvent.NODE_EXECUTE, node)
+                response = node.run_decomposition(workflow)
+                if not _is_task_result(response):
+                    pending = asyncio.ensure_future(response, loop=loop)
+                    pending.add_done_callback(lambda f, node=node: resume(node, f))
+                    return
+                node.apply_result(workflow, response)
+                if workflow.stuck_after(node):
+                    break
+        except Exception as e:
+            return done.set_exception(e)
+        done.set_result(workflow)
+
+    def resume(node, f):
+        if f.cancelled() or f.exception() is not None:
+            return _copy_outcome(f, done)
+        try:
+            node.apply_result(workflow, f.result())
+        except Exception as e:
+            return done.set_exception(e)
+        advance()
+
+    advance()
+    return done
+
+
+def process_async(processor, event, loop=None):
+    """
+    EventProcessor.process on an event loop. Events for the same workflow are
+    applied one after the other, in the order they were submitted.
+    """
+    loop = loop or asyncio.get_event_loop()
+    workflow_id = event.get_workflow_id()
+    if processor.is_duplicate(event):
+        return _resolved(None, loop)
+
+    def load(_):
+        try:
+            return _resolved(processor.workflow_base.get_workflow(workflow_id), loop)
+        except WorkflowNotFound:
+            return _then(run_async(processor.workflow_factory.create_instance(), loop=loop), register, loop)
+
+    def register(workflow_instance):
+        processor.workflow_base.add_workflow(workflow_id, workflow_instance)
+        return workflow_instance
+
+    def apply(workflow_instance):
+        if processor.is_duplicate(event):
+            # an identical event queued ahead of this one has been applied since
+            return workflow_instance
+        event.complete(workflow_instance)
+        return _then(run_async(workflow_instance, loop=loop), save, loop)
+
+    def save(workflow_instance):
+        processor.save(workflow_id, workflow_instance)
+        processor.remember(event)
+        return workflow_instance
+
+    previous = processor.in_flight.get(workflow_id)
+    if previous is None:
+        previous = _resolved(None, loop)
+    else:
+        # a failed event must not stop the following ones
+        previous = _then_always(previous, loop)
+    result = _then(_then(previous, load, loop), apply, loop)
+    processor.in_flight[workflow_id] = result
+
+    def forget(f):
+        if processor.in_flight.get(workflow_id) is f:
+            del processor.in_flight[workflow_id]
+
+    result.add_done_callback(forget)
+    return result
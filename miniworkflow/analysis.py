@@ -0,0 +1,194 @@
+"""
+Static analysis of a WorkflowSpec's graph, computed once per spec and
+shared by its instances through WorkflowSpec.analysis
+"""
+from collections import deque
+from miniworkflow import AndActivationPolicy, QuorumActivationPolicy, AlwaysActivatePolicy
+
+
+def strongly_connected_components(successors):
+    """
+    Tarjan's algorithm without recursion over an adjacency table of integer
+    ids. Components come out in reverse topological order: a component is
+    listed before any component that has an edge into it.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in xrange(len(successors)):
+        if root in index:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i == 0:
+                index[v] = low[v] = len(index)
+                stack.append(v)
+                on_stack.add(v)
+            for j in xrange(i, len(successors[v])):
+                w = successors[v][j]
+                if w not in index:
+                    work[-1] = (v, j + 1)
+                    work.append((w, 0))
+                    break
+                if w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(tuple(component))
+    return components
+
+
+class SpecAnalysis(object):
+    """
+    Structure of a spec, by integer node id:
+
+    - components / component_of: strongly connected components
+    - loops: the components that contain a cycle, and back_edges, the
+      (source, target) uuid pairs closing them in a depth-first walk
+    - reaches: bitmask of the nodes reachable from each node
+    - terminals: nodes without out-transitions; dead_ends: nodes from which
+      no terminal can be reached
+    - closed_loops: loops with no transition leaving them, and spins[id],
+      whether a node is in one whose nodes have no decomposition, always
+      activate and only have unconditional transitions, which an instance
+      can never leave nor be stopped in
+    - fan_in / required_arrivals: in-transitions and arrivals a join needs
+      (None when the policy doesn't count them); joins, the (uuid, required)
+      pairs of the nodes needing more than one
+    - deadlocking_joins: joins that can never gather the arrivals they need
+    - unreachable: uuids of nodes that feed transitions into the spec but
+      can't be reached from its start node
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        successors = spec.successors
+        nodes = len(spec)
+        self.components = strongly_connected_components(successors)
+        self.component_of = [0] * nodes
+        for c, component in enumerate(self.components):
+            for v in component:
+                self.component_of[v] = c
+        self.loops = tuple(component for component in self.components
+                           if len(component) > 1 or component[0] in successors[component[0]])
+        self.back_edges = self.__back_edges()
+        self.reaches = self.__reachability()
+        self.terminals = tuple(v for v in xrange(nodes) if not successors[v])
+        terminal_mask = sum(1 << v for v in self.terminals)
+        self.dead_ends = tuple(v for v in xrange(nodes)
+                               if v not in self.terminals and not self.reaches[v] & terminal_mask)
+        self.closed_loops = tuple(component for component in self.loops
+                                  if all(self.component_of[w] == self.component_of[component[0]]
+                                         for v in component for w in successors[v]))
+        self.spins = [False] * nodes
+        for component in self.closed_loops:
+            if all(self.__spins(spec.node_list[v]) for v in component):
+                for v in component:
+                    self.spins[v] = True
+        self.fan_in = tuple(len(node.in_transitions) for node in spec.node_list)
+        self.required_arrivals = tuple(self.__required_arrivals(node) for node in spec.node_list)
+        self.unreachable = self.__unreachable()
+        self.joins = tuple((spec.node_list[v].uuid(), required) for v, required in enumerate(self.required_arrivals)
+                           if required > 1)
+        self.deadlocking_joins = tuple(v for v in xrange(nodes) if self.__can_deadlock(v))
+
+    def can_reach(self, source_uuid, target_uuid):
+        return bool(self.reaches[self.spec.node_id(source_uuid)] >> self.spec.node_id(target_uuid) & 1)
+
+    def __spins(self, node):
+        return (node.decomposition_factory is None and type(node.activation_policy) is AlwaysActivatePolicy and
+                all(t.condition is None for t in node.out_transitions))
+
+    def __back_edges(self):
+        successors = self.spec.successors
+        uuids = [node.uuid() for node in self.spec.node_list]
+        start = self.spec.node_id(self.spec.start_node.uuid())
+        back_edges = []
+        visited = set([start])
+        on_path = set([start])
+        work = [(start, iter(successors[start]))]
+        while work:
+            v, targets = work[-1]
+            for w in targets:
+                if w in on_path:
+                    back_edges.append((uuids[v], uuids[w]))
+                elif w not in visited:
+                    visited.add(w)
+                    on_path.add(w)
+                    work.append((w, iter(successors[w])))
+                    break
+            else:
+                work.pop()
+                on_path.discard(v)
+        return tuple(back_edges)
+
+    def __reachability(self):
+        successors = self.spec.successors
+        reaches = [0] * len(successors)
+        # sinks first, so every successor outside the component is done
+        for c, component in enumerate(self.components):
+            mask = 0
+            for v in component:
+                for w in successors[v]:
+                    mask |= 1 << w
+                    if self.component_of[w] != c:
+                        mask |= reaches[w]
+            for v in component:
+                reaches[v] = mask
+        return reaches
+
+    def __required_arrivals(self, node):
+        policy = node.activation_policy
+        if isinstance(policy, AndActivationPolicy):
+            return len(node.in_transitions)
+        if isinstance(policy, QuorumActivationPolicy):
+            return policy.required
+        return None
+
+    def __unreachable(self):
+        node_ids = self.spec.node_ids
+        unreachable = set()
+        queue = deque(self.spec.node_list)
+        while queue:
+            for transition in queue.popleft().in_transitions:
+                source = transition.source_node
+                uuid = source.uuid()
+                if uuid not in node_ids and uuid not in unreachable:
+                    unreachable.add(uuid)
+                    queue.append(source)
+        return tuple(sorted(unreachable))
+
+    def __can_deadlock(self, join):
+        required = self.required_arrivals[join]
+        if required is None:
+            return False
+        # arrivals can only come from predecessors reachable without going through the join itself
+        start = self.spec.node_id(self.spec.start_node.uuid())
+        if join == start:
+            return False
+        successors = self.spec.successors
+        seen = set([start])
+        queue = deque([start])
+        while queue:
+            for w in successors[queue.popleft()]:
+                if w != join and w not in seen:
+                    seen.add(w)
+                    queue.append(w)
+        node_ids = self.spec.node_ids
+        arrivals = sum(1 for transition in self.spec.node_list[join].in_transitions
+                       if node_ids.get(transition.source_node.uuid()) in seen)
+        return arrivals < required
@@ -0,0 +1,68 @@
+"""
+Performance regression suite for the engine and the event path.
+
+Benchmarks register themselves with @benchmark. Each one is called with a
+`scale` factor and returns (operations, run), where run() performs the timed
+work once; fixtures are built outside the timing. Results are plain dicts
+so they can be written as JSON and compared against a stored baseline:
+
+    python -m miniworkflow.benchmarks --output results.json
+    python -m miniworkflow.benchmarks --baseline results.json --tolerance 0.2
+"""
+import platform
+import time
+from collections import OrderedDict
+
+registry = OrderedDict()
+
+
+def benchmark(f):
+    registry[f.__name__] = f
+    return f
+
+
+def measure(f, scale=1.0, repeat=5, timer=time.time):
+    times = []
+    operations = None
+    for _ in xrange(repeat):
+        # fresh fixtures each round: several benchmarks consume theirs
+        operations, run = f(scale)
+        started = timer()
+        run()
+        times.append(timer() - started)
+    times.sort()
+    best = times[0]
+    return OrderedDict([('operations', operations),
+                        ('best', best),
+                        ('median', times[len(times) // 2]),
+                        ('operations_per_second', operations / best if best else None)])
+
+
+def run_benchmarks(names=None, scale=1.0, repeat=5, report=None):
+    # importing the suite fills the registry
+    from miniworkflow.benchmarks import suite
+    results = OrderedDict()
+    for name, f in registry.iteritems():
+        if names and name not in names:
+            continue
+        results[name] = measure(f, scale, repeat)
+        if report is not None:
+            report(name, results[name])
+    return {'python': platform.python_version(), 'scale': scale, 'repeat': repeat, 'benchmarks': results,
+            'memory': suite.footprint()}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    (name, baseline best, current best, ratio, regressed) for the benchmarks
+    present in both; a benchmark regressed when it got slower than
+    `tolerance` allows
+    """
+    rows = []
+    for name, current in results['benchmarks'].iteritems():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None or not previous['best']:
+            continue
+        ratio = current['best'] / previous['best']
+        rows.append((name, previous['best'], current['best'], ratio, ratio > 1 + tolerance))
+    return rows
@@ -0,0 +1,41 @@
+import argparse
+import sys
+import simplejson
+from miniworkflow.benchmarks import run_benchmarks, compare
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m miniworkflow.benchmarks")
+    parser.add_argument('names', nargs='*', help="benchmarks to run, all by default")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies every benchmark's size")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results to compare against; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    def report(name, result):
+        print "%-28s %10.4fs %14.0f ops/s" % (name, result['best'], result['operations_per_second'] or 0)
+
+    results = run_benchmarks(args.names, args.scale, args.repeat, report)
+    for name, value in sorted(results['memory'].iteritems()):
+        print "%-28s %10d" % (name, value)
+    if args.output:
+        with open(args.output, 'w') as f:
+            simplejson.dump(results, f, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = simplejson.load(f)
+    regressions = 0
+    print
+    for name, before, after, ratio, regressed in compare(results, baseline, args.tolerance):
+        regressions += regressed
+        print "%-28s %10.4fs -> %10.4fs %6.2fx%s" % (name, before, after, ratio, "  REGRESSED" if regressed else "")
+    for name, value in sorted(baseline.get('memory', {}).iteritems()):
+        print "%-28s %10d -> %10d" % (name, value, results['memory'][name])
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
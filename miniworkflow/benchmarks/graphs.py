@@ -0,0 +1,82 @@
+"""
+Workflow definitions the benchmarks run
+"""
+from miniworkflow import Node, Transition, AndActivationPolicy, TaskResult, WaitForExternalEvent
+from miniworkflow.expressions import Condition
+
+
+class CountDown(object):
+    def get_instance(self):
+        return self
+
+    def execute(self, node, workflow):
+        workflow.update_workflow_variables({'left': workflow.workflow_variables['left'] - 1})
+        return TaskResult.COMPLETED
+
+
+def wide_fan_out(width):
+    """
+    start -> `width` parallel nodes -> end, which runs once per branch
+    """
+    start = Node("start")
+    end = Node("end")
+    for i in xrange(width):
+        branch = Node("branch_%d" % i)
+        start.connect(Transition(branch))
+        branch.connect(Transition(end))
+    return start
+
+
+def deep_chain(depth):
+    """
+    `depth` nodes in a row
+    """
+    start = previous = Node("step_0")
+    for i in xrange(1, depth):
+        node = Node("step_%d" % i)
+        previous.connect(Transition(node))
+        previous = node
+    return start
+
+
+def and_join(width):
+    """
+    start -> `width` parallel nodes -> AND join
+    """
+    start = Node("start")
+    join = Node("join", activation_policy=AndActivationPolicy())
+    for i in xrange(width):
+        branch = Node("branch_%d" % i)
+        start.connect(Transition(branch))
+        branch.connect(Transition(join))
+    return start
+
+
+def count_down_loop():
+    """
+    start -> body <-> check until the `left` variable reaches 0, then end
+    """
+    start = Node("start")
+    body = Node("body")
+    check = Node("check")
+    end = Node("end")
+    body.set_decomposition_factory(CountDown())
+    start.connect(Transition(body))
+    body.connect(Transition(check))
+    check.connect(Transition(body, Condition("left > 0")))
+    check.connect(Transition(end, Condition("left <= 0")))
+    return start
+
+
+def mail_loop():
+    """
+    start -> wait_for_mail (waits) -> process_mail -> wait_for_mail
+    """
+    start = Node("start")
+    wait_for_mail = Node("wait_for_mail")
+    process_mail = Node("process_mail")
+    wait_for_mail.set_decomposition_factory(WaitForExternalEvent())
+    start.connect(Transition(wait_for_mail))
+    wait_for_mail.connect(Transition(process_mail))
+    process_mail.connect(Transition(wait_for_mail))
+    return start
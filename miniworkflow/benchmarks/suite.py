@@ -0,0 +1,170 @@
+import sys
+from StringIO import StringIO
+from miniworkflow import MiniWorkflow, WorkflowFactory, WorkflowNotFound, WorkflowObserver, WorkflowEvent, \
+    EventProcessor, EmailReceivedEvent, Node
+from miniworkflow.benchmarks import benchmark, graphs
+from miniworkflow.encoding import encode_workflow, decode_state
+from miniworkflow.store import SqliteWorkflowBase
+
+
+def _size(n, scale):
+    return max(1, int(n * scale))
+
+
+def _run(start, variables=None):
+    w = MiniWorkflow(start, workflow_variables=variables)
+    w.spec  # compile outside the timing
+    return w
+
+
+@benchmark
+def run_wide_fan_out(scale):
+    width = _size(2000, scale)
+    w = _run(graphs.wide_fan_out(width))
+    # end runs once per branch
+    return 2 * width + 1, w.run
+
+
+@benchmark
+def run_deep_chain(scale):
+    w = _run(graphs.deep_chain(_size(5000, scale)))
+    return len(w.spec), w.run
+
+
+@benchmark
+def run_and_join(scale):
+    w = _run(graphs.and_join(_size(2000, scale)))
+    return len(w.spec), w.run
+
+
+@benchmark
+def run_long_loop(scale):
+    left = _size(5000, scale)
+    w = _run(graphs.count_down_loop(), {'left': left})
+    return left * 2 + 2, w.run
+
+
+class _DictWorkflowBase(object):
+    def __init__(self):
+        self.workflows = {}
+
+    def get_workflow(self, workflow_id):
+        try:
+            return self.workflows[workflow_id]
+        except KeyError:
+            raise WorkflowNotFound(workflow_id)
+
+    def add_workflow(self, workflow_id, w):
+        self.workflows[workflow_id] = w
+
+    def save_workflow(self, workflow_id, w):
+        pass
+
+
+def _mail_events(events, scale):
+    workflows = _size(100, scale)
+    return [EmailReceivedEvent(i % workflows, 'wait_for_mail') for i in xrange(_size(events, scale))]
+
+
+@benchmark
+def event_processor_in_memory(scale):
+    events = _mail_events(5000, scale)
+    processor = EventProcessor(_DictWorkflowBase(), WorkflowFactory(graphs.mail_loop(), trace_limit=16))
+
+    def run():
+        for event in events:
+            processor.process(event)
+    return len(events), run
+
+
+@benchmark
+def event_processor_sqlite(scale):
+    events = _mail_events(1000, scale)
+    factory = WorkflowFactory(graphs.mail_loop(), trace_limit=16)
+    processor = EventProcessor(SqliteWorkflowBase(':memory:', factory), factory)
+
+    def run():
+        for event in events:
+            processor.process(event)
+    return len(events), run
+
+
+@benchmark
+def state_round_trip(scale):
+    w = _run(graphs.count_down_loop(), {'left': 2000})
+    w.run()
+    w.update_workflow_variables(dict(('var_%d' % i, {'value': i}) for i in xrange(200)))
+    copy = MiniWorkflow(w.start_node, spec=w.spec)
+    rounds = _size(100, scale)
+
+    def run():
+        for _ in xrange(rounds):
+            copy.set_state(w.get_state())
+    return rounds, run
+
+
+@benchmark
+def write_graph(scale):
+    start = graphs.wide_fan_out(_size(5000, scale))
+    return _size(5000, scale) + 2, lambda: start.write_graph(StringIO())
+
+
+class _Subscriber(object):
+    def notify(self, event, data):
+        pass
+
+
+@benchmark
+def observer_dispatch(scale):
+    observer = WorkflowObserver()
+    for _ in xrange(10):
+        observer.subscribe(WorkflowEvent.NODE_COMPLETED, _Subscriber())
+    node = Node("node")
+    notifications = _size(50000, scale)
+
+    def run():
+        for _ in xrange(notifications):
+            observer.notify(WorkflowEvent.NODE_COMPLETED, node)
+    return notifications, run
+
+
+def _deep_size(o):
+    size = sys.getsizeof(o)
+    attributes = getattr(o, '__dict__', None)
+    if attributes is not None:
+        size += sys.getsizeof(attributes)
+    return size
+
+
+def footprint():
+    """
+    Bytes per node and per transition of a definition: the objects, their
+    attribute dicts when they have one and each node's transition lists
+    """
+    start = graphs.deep_chain(100)
+    nodes = MiniWorkflow(start).spec.node_list
+    transitions = [t for node in nodes for t in node.out_transitions]
+    node_bytes = sum(_deep_size(node) + sys.getsizeof(node.in_transitions) + sys.getsizeof(node.out_transitions)
+                     for node in nodes)
+    return {'bytes_per_node': node_bytes / len(nodes),
+            'bytes_per_transition': sum(_deep_size(t) for t in transitions) / len(transitions)}
+
+
+@benchmark
+def create_instances(scale):
+    factory = WorkflowFactory(graphs.mail_loop())
+    n = _size(5000, scale)
+    return n, lambda: factory.create_instances(n)
+
+
+@benchmark
+def binary_state_round_trip(scale):
+    w = _run(graphs.count_down_loop(), {'left': 2000})
+    w.run()
+    copy = MiniWorkflow(w.start_node, spec=w.spec)
+    rounds = _size(100, scale)
+
+    def run():
+        for _ in xrange(rounds):
+            copy.set_state(decode_state(encode_workflow(w), w.spec))
+    return rounds, run
@@ -1,9 +1,23 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from Queue import Queue, Empty
 import pika
 import simplejson
 
+logger = logging.getLogger(__name__)
+
+
+def default_connection_factory():
+    return pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+
+
 class WorkflowEventPublisher(object):
-    def __init__(self, exchange):
+    def __init__(self, exchange, connection_factory=default_connection_factory):
         self.exchange = exchange
+        self.connection_factory = connection_factory
         self.__channel = None
         self.__connection = None
 
@@ -21,6 +35,149 @@ class WorkflowEventPublisher(object):
 
     def get_channel(self):
         if not self.__channel:
-            self.__connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+            self.__connection = self.connection_factory()
             self.__channel = self.__connection.channel()
-        return self.__channel
\ No newline at end of file
+        return self.__channel
+
+
+class EventBatcher(object):
+    """
+    Publishing pipeline shared by every BatchingWorkflowEventPublisher of a
+    process: one broker connection owned by one background thread, fed
+    through a bounded queue. Buffered events are published whenever
+    `batch_size` of them are queued or the oldest is `flush_interval` seconds
+    old. Each event stays its own message, a JSON object as published by
+    WorkflowEventPublisher; with `packed`, a batch is sent as one message per
+    exchange and routing key whose body is a JSON list of those objects,
+    which consumers have to expect. Once `max_pending` events are queued,
+    publishers block until the thread catches up. A batch that fails to
+    publish is logged and dropped, and the next one reconnects.
+    """
+    _STOP = object()
+
+    def __init__(self, connection_factory=default_connection_factory, batch_size=100, flush_interval=0.05,
+                 max_pending=10000, exchange='amq.topic', packed=False):
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # for put() calls that don't name one
+        self.exchange = exchange
+        self.packed = packed
+        self.queue = Queue(max_pending)
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    def put(self, routing_key, message, exchange=None):
+        self.__ensure_started()
+        self.queue.put((exchange or self.exchange, routing_key, message))
+
+    def flush(self):
+        """
+        Block until every event handed to put() so far has been published
+        """
+        if self.__thread is not None:
+            self.queue.join()
+
+    def shutdown(self):
+        with self.__lock:
+            thread, self.__thread = self.__thread, None
+        if thread is not None:
+            self.queue.put(self._STOP)
+            thread.join()
+
+    def __ensure_started(self):
+        if self.__thread is None:
+            with self.__lock:
+                if self.__thread is None:
+                    self.__thread = threading.Thread(target=self.__run, name="workflow-event-batcher")
+                    self.__thread.daemon = True
+                    self.__thread.start()
+
+    def __run(self):
+        connection = channel = None
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+            if batch[-1] is self._STOP:
+                stopping = True
+            events = [item for item in batch if item is not self._STOP]
+            try:
+                if events:
+                    if channel is None:
+                        connection = self.connection_factory()
+                        channel = connection.channel()
+                    self.__publish(channel, events)
+            except Exception:
+                logger.exception("dropping %d workflow events that failed to publish", len(events))
+                self.__close(connection)
+                connection = channel = None
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        self.__close(connection)
+
+    def __close(self, connection):
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception:
+            logger.exception("failed closing the broker connection")
+
+    def __publish(self, channel, batch):
+        if not self.packed:
+            for exchange, routing_key, message in batch:
+                channel.basic_publish(exchange=exchange, routing_key=routing_key, body=simplejson.dumps(message))
+            return
+        by_destination = OrderedDict()
+        for exchange, routing_key, message in batch:
+            by_destination.setdefault((exchange, routing_key), []).append(message)
+        for (exchange, routing_key), messages in by_destination.iteritems():
+            channel.basic_publish(exchange=exchange, routing_key=routing_key, body=simplejson.dumps(messages))
+
+
+_shared_batchers = {}
+_shared_batcher_lock = threading.Lock()
+
+
+def shared_batcher(**kwargs):
+    """
+    The EventBatcher of the current process, created on first use. A forked
+    child gets its own instead of sharing the parent's connection.
+    """
+    pid = os.getpid()
+    with _shared_batcher_lock:
+        if pid not in _shared_batchers:
+            _shared_batchers.clear()
+            _shared_batchers[pid] = EventBatcher(**kwargs)
+        return _shared_batchers[pid]
+
+
+class BatchingWorkflowEventPublisher(object):
+    """
+    Drop-in replacement for WorkflowEventPublisher that hands events to an
+    EventBatcher instead of publishing them from the stepping thread
+    """
+
+    def __init__(self, exchange, batcher=None, routing_key='workflow_ticketing'):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.batcher = batcher or shared_batcher()
+
+    def notify(self, event, node):
+        self.batcher.put(self.routing_key, {'event': event, 'data': node.description}, self.exchange)
+
+    def flush(self):
+        self.batcher.flush()
+
+    def shutdown(self):
+        self.batcher.flush()
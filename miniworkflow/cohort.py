@@ -0,0 +1,237 @@
+"""
+Vectorized stepping of many instances of one WorkflowSpec.
+
+A Cohort keeps the execution state of `size` instances as NumPy matrices
+with one row per instance and one column per node of the spec: active and
+waiting counts, execution counts and join arrivals. Each step() sweeps the
+nodes in spec order and executes one activation of the node in every
+instance that has it active, with array operations for the bookkeeping,
+AND/quorum joins and declarative Conditions. Per-instance Python code only
+runs for nodes with a decomposition, lambda conditions and custom activation
+policies; they see a lightweight stand-in for the MiniWorkflow.
+
+Differences from stepping MiniWorkflows one by one: active nodes execute in
+node order rather than activation order, only execution counts are kept (no
+traces), observers are not notified and timers are not supported. get_state()
+exports one instance in a form MiniWorkflow.set_state accepts, to continue it
+on its own, e.g. through an EventProcessor.
+"""
+import numpy
+
+from miniworkflow import TaskResult, WorkflowSpec, WorkflowVariables, Node, AlwaysActivatePolicy, \
+    AndActivationPolicy, QuorumActivationPolicy, DiscriminatorActivationPolicy
+from miniworkflow.expressions import Condition
+
+_ALWAYS = -1
+
+_REQUIRED_ARRIVALS = {
+    AlwaysActivatePolicy: lambda node: _ALWAYS,
+    AndActivationPolicy: lambda node: len(node.in_transitions),
+    QuorumActivationPolicy: lambda node: node.activation_policy.required,
+    DiscriminatorActivationPolicy: lambda node: node.activation_policy.required,
+}
+
+
+class Cohort(object):
+    def __init__(self, spec, size, workflow_variables=None):
+        if not isinstance(spec, WorkflowSpec):
+            spec = WorkflowSpec(spec)
+        for node in spec.node_list:
+            if node.timeout is not None or any(t.delay is not None for t in node.out_transitions):
+                raise ValueError("cohorts don't support timers, %r has one" % node)
+        self.spec = spec
+        self.size = size
+        shape = (size, len(spec))
+        self.active = numpy.zeros(shape, numpy.int32)
+        self.waiting = numpy.zeros(shape, numpy.int32)
+        self.executed = numpy.zeros(shape, numpy.int32)
+        self.arrivals = numpy.zeros(shape, numpy.int32)
+        self.variables = [WorkflowVariables(workflow_variables) for _ in xrange(size)]
+        self.executions = 0
+        self.__targets = [[spec.node_id(t.target_node.uuid()) for t in node.out_transitions]
+                          for node in spec.node_list]
+        # None when the policy has to be asked instance by instance
+        self.__required = [_REQUIRED_ARRIVALS.get(type(node.activation_policy), lambda node: None)(node)
+                           for node in spec.node_list]
+        # declarative conditions are memoized per instance: 1 true, 0 false, -1 stale
+        self.__columns = {}
+        for node in spec.node_list:
+            for t in node.out_transitions:
+                if isinstance(t.condition, Condition):
+                    self.__columns.setdefault(t.condition, len(self.__columns))
+        self.condition_values = numpy.full((size, len(self.__columns)), -1, numpy.int8)
+        self.active[:, spec.node_id(spec.start_node.uuid())] = 1
+
+    def __len__(self):
+        return self.size
+
+    def step(self):
+        """
+        One sweep over the nodes; returns the number of node executions
+        """
+        executions = 0
+        for j, node in enumerate(self.spec.node_list):
+            rows = numpy.flatnonzero(self.active[:, j])
+            if not len(rows):
+                continue
+            executions += len(rows)
+            self.__pop_active(rows, j)
+            if node.decomposition_factory is None:
+                self.__completed(rows, j)
+                continue
+            waits = numpy.array([self.__run_decomposition(node, i) == TaskResult.WAIT for i in rows], bool)
+            self.__push_waiting(rows[waits], j)
+            self.__completed(rows[~waits], j)
+        self.executions += executions
+        return executions
+
+    def run(self, max_steps=None):
+        while self.active.any() and max_steps != 0:
+            if max_steps is not None:
+                max_steps -= 1
+            self.step()
+
+    def complete_waiting(self, uuid, data):
+        """
+        Complete `uuid` in every instance waiting on it. Call run() next.
+        Returns the indices of the instances that were completed.
+        """
+        j = self.spec.node_id(uuid)
+        rows = numpy.flatnonzero(self.waiting[:, j])
+        node = self.spec.node_list[j]
+        if type(node).process_async_completion != Node.process_async_completion:
+            for i in rows:
+                node.process_async_completion(_CohortMember(self, i), data)
+        self.__completed(rows, j)
+        return rows
+
+    def complete_by_uuid(self, i, uuid, data):
+        j = self.spec.node_id(uuid)
+        assert self.waiting[i, j], "instance %d is not waiting on %s" % (i, uuid)
+        self.spec.node_list[j].process_async_completion(_CohortMember(self, i), data)
+        self.__completed(numpy.array([i]), j)
+
+    def count_waiting(self, uuid):
+        return int(numpy.count_nonzero(self.waiting[:, self.spec.node_id(uuid)]))
+
+    def finished(self):
+        """
+        Indices of the instances with no active nodes
+        """
+        return numpy.flatnonzero(~self.active.any(axis=1))
+
+    def update_workflow_variables(self, i, update):
+        variables = self.variables[i]
+        changes = variables.changes(update)
+        variables._update(changes)
+        for key in changes:
+            for condition in self.spec.conditions_by_variable.get(key, ()):
+                self.condition_values[i, self.__columns[condition]] = -1
+
+    def get_state(self, i):
+        """
+        State of instance `i` for MiniWorkflow.set_state, without traces
+        """
+        uuids = [node.uuid() for node in self.spec.node_list]
+
+        def expand(row):
+            return [uuids[j] for j in numpy.flatnonzero(row) for _ in xrange(row[j])]
+
+        return {'activation_trace': [], 'waiting_trace': [], 'executed_trace': [],
+                'active_nodes': expand(self.active[i]),
+                'waiting_list': expand(self.waiting[i]),
+                'execution_counts': dict((uuids[j], int(self.executed[i, j]))
+                                         for j in numpy.flatnonzero(self.executed[i])),
+                'timers': [],
+                'workflow_variables': self.variables[i].snapshot()}
+
+    def has_executed(self, rows, j):
+        return (self.executed[rows, j] > 0) & (self.waiting[rows, j] == 0) & (self.active[rows, j] == 0)
+
+    def __signal_arrivals(self, rows, j, had_executed):
+        has_executed = self.has_executed(rows, j)
+        gained = rows[has_executed & ~had_executed]
+        lost = rows[had_executed & ~has_executed]
+        for k in self.__targets[j]:
+            self.arrivals[gained, k] += 1
+            self.arrivals[lost, k] -= 1
+
+    def __pop_active(self, rows, j):
+        had_executed = self.has_executed(rows, j)
+        self.active[rows, j] -= 1
+        self.__signal_arrivals(rows, j, had_executed)
+
+    def __push_active(self, rows, j):
+        had_executed = self.has_executed(rows, j)
+        self.active[rows, j] += 1
+        self.__signal_arrivals(rows, j, had_executed)
+
+    def __push_waiting(self, rows, j):
+        had_executed = self.has_executed(rows, j)
+        self.waiting[rows, j] += 1
+        self.__signal_arrivals(rows, j, had_executed)
+
+    def __mark_executed(self, rows, j):
+        had_executed = self.has_executed(rows, j)
+        waited = rows[self.waiting[rows, j] > 0]
+        self.waiting[waited, j] -= 1
+        self.executed[rows, j] += 1
+        self.__signal_arrivals(rows, j, had_executed)
+
+    def __completed(self, rows, j):
+        self.__mark_executed(rows, j)
+        node = self.spec.node_list[j]
+        for transition, k in zip(node.out_transitions, self.__targets[j]):
+            passed = rows[self.__eval(transition, rows, node)]
+            if len(passed):
+                self.__activate(passed, k)
+
+    def __activate(self, rows, k):
+        required = self.__required[k]
+        if required is None:
+            node = self.spec.node_list[k]
+            rows = rows[numpy.array([node.can_execute_in(_CohortMember(self, i)) for i in rows], bool)]
+        elif required != _ALWAYS:
+            rows = rows[self.arrivals[rows, k] == required]
+        self.__push_active(rows, k)
+
+    def __eval(self, transition, rows, node):
+        condition = transition.condition
+        if condition is None:
+            return numpy.ones(len(rows), bool)
+        column = self.__columns.get(condition)
+        if column is None:
+            return numpy.array([bool(condition(_CohortMember(self, i), node)) for i in rows], bool)
+        values = self.condition_values[rows, column]
+        for i in rows[values < 0]:
+            self.condition_values[i, column] = condition.evaluate(self.variables[i])
+        return self.condition_values[rows, column] > 0
+
+    def __run_decomposition(self, node, i):
+        response = node.run_decomposition(_CohortMember(self, i))
+        if response not in (TaskResult.COMPLETED, TaskResult.WAIT):
+            raise ValueError("cohorts need synchronous decompositions, %r returned %r" % (node, response))
+        return response
+
+
+class _CohortMember(object):
+    """
+    What decompositions, conditions and activation policies see of a
+    cohort instance instead of a MiniWorkflow
+    """
+
+    def __init__(self, cohort, i):
+        self.cohort = cohort
+        self.index = i
+        self.spec = cohort.spec
+        self.nodes = cohort.spec.nodes
+        self.workflow_variables = cohort.variables[i]
+
+    def update_workflow_variables(self, update):
+        self.cohort.update_workflow_variables(self.index, update)
+
+    def satisfied_arcs(self, a_node):
+        return self.cohort.arrivals[self.index, self.spec.node_id(a_node.uuid())]
+
+    def has_executed(self, a_node):
+        return bool(self.cohort.has_executed(numpy.array([self.index]), self.spec.node_id(a_node.uuid()))[0])
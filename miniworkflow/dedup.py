@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+
+
+class EventDedupIndex(object):
+    """
+    Remembers the ids of the events recently applied to each workflow so a
+    redelivered event can be rejected in O(1), before its workflow is loaded.
+    Each workflow keeps at most `capacity` ids; when `window` is set, ids
+    older than `window` seconds (as measured by `clock`) are forgotten too.
+    At most `max_workflows` workflows are tracked, the least recently added
+    to are dropped first, and EventProcessor forgets a workflow once it has
+    finished.
+    """
+
+    def __init__(self, capacity=1000, window=None, clock=time.time, max_workflows=10000):
+        self.capacity = capacity
+        self.window = window
+        self.clock = clock
+        self.max_workflows = max_workflows
+        self.__seen = OrderedDict()
+
+    def seen(self, workflow_id, event_id):
+        events = self.__seen.get(workflow_id)
+        if not events:
+            return False
+        self.__expire(workflow_id, events)
+        return event_id in events
+
+    def add(self, workflow_id, event_id):
+        events = self.__seen.pop(workflow_id, None)
+        if events is None:
+            events = OrderedDict()
+        self.__seen[workflow_id] = events
+        events.pop(event_id, None)
+        events[event_id] = self.clock()
+        while len(events) > self.capacity:
+            events.popitem(last=False)
+        while len(self.__seen) > self.max_workflows:
+            self.__seen.popitem(last=False)
+        self.__expire(workflow_id, events)
+
+    def forget(self, workflow_id):
+        self.__seen.pop(workflow_id, None)
+
+    def __expire(self, workflow_id, events):
+        if self.window is None:
+            return
+        oldest_kept = self.clock() - self.window
+        while events and next(events.itervalues()) < oldest_kept:
+            events.popitem(last=False)
+        if not events:
+            del self.__seen[workflow_id]
+
+    def __len__(self):
+        return sum(len(events) for events in self.__seen.itervalues())
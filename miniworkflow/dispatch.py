@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+from Queue import Queue, Full
+from miniworkflow import WorkflowObserver
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchPolicy(object):
+    BLOCK = "block"
+    DROP = "drop"
+
+
+class EventDispatcher(object):
+    """
+    Delivers observer events from a pool of worker threads ("lanes"). Each
+    subscriber is pinned to one lane, so it sees its events in the order they
+    were emitted, while a slow subscriber only holds back its own lane. Lanes
+    buffer at most `max_pending` events; past that, `policy` decides whether
+    the emitting thread blocks or the event is dropped (and counted).
+    """
+    _STOP = object()
+
+    def __init__(self, lanes=1, max_pending=10000, policy=DispatchPolicy.BLOCK):
+        self.policy = policy
+        self.dropped = 0
+        self.__queues = [Queue(max_pending) for _ in range(lanes)]
+        self.__threads = None
+        self.__lock = threading.Lock()
+
+    def dispatch(self, subscriber, event, data):
+        self.__ensure_started()
+        queue = self.__queues[hash(subscriber) % len(self.__queues)]
+        item = (subscriber, event, data)
+        if self.policy == DispatchPolicy.BLOCK:
+            queue.put(item)
+        else:
+            try:
+                queue.put_nowait(item)
+            except Full:
+                with self.__lock:
+                    self.dropped += 1
+
+    def flush(self):
+        """
+        Block until every event dispatched so far has been delivered
+        """
+        if self.__threads is not None:
+            for queue in self.__queues:
+                queue.join()
+
+    def shutdown(self):
+        with self.__lock:
+            threads, self.__threads = self.__threads, None
+        if threads is not None:
+            for queue in self.__queues:
+                queue.put(self._STOP)
+            for thread in threads:
+                thread.join()
+
+    def __ensure_started(self):
+        if self.__threads is None:
+            with self.__lock:
+                if self.__threads is None:
+                    threads = [threading.Thread(target=self.__deliver, args=(queue,),
+                                                name="workflow-observer-%d" % i)
+                               for i, queue in enumerate(self.__queues)]
+                    for thread in threads:
+                        thread.daemon = True
+                        thread.start()
+                    self.__threads = threads
+
+    def __deliver(self, queue):
+        while True:
+            item = queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                subscriber, event, data = item
+                try:
+                    subscriber.notify(event, data)
+                except Exception:
+                    logger.exception("%r failed handling %s", subscriber, event)
+            finally:
+                queue.task_done()
+
+
+_shared_dispatchers = {}
+_shared_dispatcher_lock = threading.Lock()
+
+
+def shared_dispatcher(**kwargs):
+    """
+    The EventDispatcher of the current process, created on first use
+    """
+    pid = os.getpid()
+    with _shared_dispatcher_lock:
+        if pid not in _shared_dispatchers:
+            _shared_dispatchers.clear()
+            _shared_dispatchers[pid] = EventDispatcher(**kwargs)
+        return _shared_dispatchers[pid]
+
+
+class AsyncWorkflowObserver(WorkflowObserver):
+    """
+    WorkflowObserver that hands events to an EventDispatcher instead of
+    calling subscribers inline, so the engine never waits on them
+    """
+
+    def __init__(self, dispatcher=None):
+        super(AsyncWorkflowObserver, self).__init__()
+        self.dispatcher = dispatcher or shared_dispatcher()
+
+    def notify(self, event, data):
+        for interested_party in self.subscribers.get(event, []):
+            self.dispatcher.dispatch(interested_party, event, data)
+
+    def flush(self):
+        self.dispatcher.flush()
@@ -0,0 +1,262 @@
+"""
+Compact binary encoding of MiniWorkflow state.
+
+Nodes are written as their integer id in the spec, counters and lengths as
+varints, traces and queues as packed little-endian id arrays (1, 2 or 4
+bytes per id, whatever the spec's size needs) and timers as
+(kind, node id, float64 deadline) triples, wait start times as float64s per
+node id (NaN for unknown), trace totals as one varint per trace; workflow
+variables stay JSON.
+Layout, version 1:
+
+    "MWS" | version varint | spec fingerprint varint | section*
+    section = tag byte | payload length varint | payload
+
+Readers skip sections with unknown tags, so later versions can add some.
+decode_state indexes the sections without decoding them: each key is
+decoded the first time it is read. The result can be passed to
+MiniWorkflow.set_state like a get_state() dict.
+"""
+import struct
+import sys
+import zlib
+from array import array
+from collections import Mapping
+import simplejson
+from miniworkflow import TimerKind
+
+MAGIC = "MWS"
+VERSION = 1
+
+_ID_LISTS = {1: 'activation_trace', 2: 'waiting_trace', 3: 'executed_trace', 4: 'waiting_list', 5: 'active_nodes'}
+_EXECUTION_COUNTS = 6
+_TIMERS = 7
+_WORKFLOW_VARIABLES = 8
+_WAITING_SINCE = 9
+_TRACE_TOTALS = 10
+_TRACES = ('activation_trace', 'waiting_trace', 'executed_trace')
+_TAGS = dict((key, tag) for tag, key in _ID_LISTS.items())
+_TAGS.update(execution_counts=_EXECUTION_COUNTS, timers=_TIMERS, workflow_variables=_WORKFLOW_VARIABLES,
+             waiting_since=_WAITING_SINCE, trace_totals=_TRACE_TOTALS)
+
+_TIMER_KINDS = (TimerKind.TIMEOUT, TimerKind.ACTIVATE)
+_ID_TYPECODES = {1: 'B', 2: 'H', 4: 'I'}
+_DEADLINE = struct.Struct('<d')
+
+
+def spec_fingerprint(spec):
+    """
+    CRC of the node uuids in id order and of every transition's
+    (source, target) pair, so a rewired spec with the same nodes is told apart
+    """
+    crc = zlib.crc32('\0'.join(node.uuid() for node in spec.node_list))
+    crc = zlib.crc32(''.join('\1%d>%d' % (source, target)
+                             for source, targets in enumerate(spec.successors) for target in targets), crc)
+    return crc & 0xffffffff
+
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data, offset):
+    n = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, offset
+        shift += 7
+
+
+def _section(out, tag, payload):
+    out.append(tag)
+    _write_varint(out, len(payload))
+    out.extend(payload)
+
+
+def _id_width(spec):
+    return 1 if len(spec) <= 0x100 else 2 if len(spec) <= 0x10000 else 4
+
+
+def _ids(ids, width):
+    packed = array(_ID_TYPECODES[width], ids)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    payload = bytearray()
+    _write_varint(payload, len(packed))
+    payload.append(width)
+    payload.extend(packed.tostring())
+    return payload
+
+
+def _encode(spec, id_lists, execution_counts, timers, waiting_since, trace_totals, workflow_variables):
+    node_ids = spec.node_ids
+    out = bytearray(MAGIC)
+    _write_varint(out, VERSION)
+    _write_varint(out, spec_fingerprint(spec))
+    width = _id_width(spec)
+    for tag, key in sorted(_ID_LISTS.items()):
+        _section(out, tag, _ids(id_lists[key], width))
+    payload = bytearray()
+    _write_varint(payload, len(execution_counts))
+    for uuid, executions in execution_counts.iteritems():
+        _write_varint(payload, node_ids[uuid])
+        _write_varint(payload, executions)
+    _section(out, _EXECUTION_COUNTS, payload)
+    payload = bytearray()
+    _write_varint(payload, len(timers))
+    for kind, uuid, deadline in timers:
+        payload.append(_TIMER_KINDS.index(kind))
+        _write_varint(payload, node_ids[uuid])
+        payload.extend(_DEADLINE.pack(deadline))
+    _section(out, _TIMERS, payload)
+    payload = bytearray()
+    _write_varint(payload, len(waiting_since))
+    for uuid, times in waiting_since.iteritems():
+        _write_varint(payload, node_ids[uuid])
+        _write_varint(payload, len(times))
+        for started in times:
+            payload.extend(_DEADLINE.pack(float('nan') if started is None else started))
+    _section(out, _WAITING_SINCE, payload)
+    payload = bytearray()
+    _write_varint(payload, len(_TRACES))
+    for key in _TRACES:
+        _write_varint(payload, trace_totals.get(key, len(id_lists[key])))
+    _section(out, _TRACE_TOTALS, payload)
+    _section(out, _WORKFLOW_VARIABLES, simplejson.dumps(workflow_variables, separators=(',', ':')))
+    return str(out)
+
+
+def encode_workflow(w):
+    """
+    Binary state of a live instance, read straight from its id-based traces
+    """
+    node_ids = w.spec.node_ids
+    id_lists = dict((key, getattr(w, key).node_ids()) for key in _TRACES)
+    id_lists['waiting_list'] = [node_ids[uuid] for uuid in w.waiting_list]
+    id_lists['active_nodes'] = [node_ids[uuid] for uuid in w.active_nodes]
+    return _encode(w.spec, id_lists, w.execution_counts,
+                   [(kind, uuid, deadline) for (kind, uuid), deadline in w.timers.iteritems()],
+                   w.waiting_since, dict((key, getattr(w, key).total) for key in _TRACES),
+                   w.workflow_variables.snapshot())
+
+
+def encode_state(state, spec):
+    """
+    Binary form of a MiniWorkflow.get_state() dict
+    """
+    node_ids = spec.node_ids
+    id_lists = dict((key, [node_ids[uuid] for uuid in state[key]]) for key in _ID_LISTS.values())
+    execution_counts = state.get('execution_counts')
+    if execution_counts is None:
+        execution_counts = {}
+        for uuid in state['executed_trace']:
+            execution_counts[uuid] = execution_counts.get(uuid, 0) + 1
+    return _encode(spec, id_lists, execution_counts, state.get('timers', []), state.get('waiting_since', {}),
+                   state.get('trace_totals', {}), state['workflow_variables'])
+
+
+def decode_state(data, spec):
+    return EncodedState(data, spec)
+
+
+class EncodedState(Mapping):
+    """
+    Read-only get_state()-like mapping over an encoded state, decoding each
+    key on first access
+    """
+
+    def __init__(self, data, spec):
+        self.data = bytearray(data)
+        self.spec = spec
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not an encoded workflow state")
+        version, offset = _read_varint(self.data, len(MAGIC))
+        if version > VERSION:
+            raise ValueError("state encoded with version %d, this reader knows up to %d" % (version, VERSION))
+        fingerprint, offset = _read_varint(self.data, offset)
+        if fingerprint != spec_fingerprint(spec):
+            raise ValueError("state was encoded for a different spec")
+        self.__sections = {}
+        while offset < len(self.data):
+            tag = self.data[offset]
+            length, offset = _read_varint(self.data, offset + 1)
+            self.__sections[tag] = (offset, offset + length)
+            offset += length
+        self.__decoded = {}
+        self.__node_uuids = None
+
+    def decoded(self):
+        """
+        Keys decoded so far
+        """
+        return set(self.__decoded)
+
+    def __getitem__(self, key):
+        try:
+            return self.__decoded[key]
+        except KeyError:
+            if key not in _TAGS or _TAGS[key] not in self.__sections:
+                raise
+        value = self.__decoded[key] = self.__decode(_TAGS[key], *self.__sections[_TAGS[key]])
+        return value
+
+    def __iter__(self):
+        return (key for key, tag in _TAGS.iteritems() if tag in self.__sections)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __uuids(self):
+        if self.__node_uuids is None:
+            self.__node_uuids = [node.uuid() for node in self.spec.node_list]
+        return self.__node_uuids
+
+    def __decode(self, tag, offset, end):
+        data = self.data
+        if tag == _WORKFLOW_VARIABLES:
+            return simplejson.loads(str(data[offset:end]))
+        node_list = self.spec.node_list
+        n, offset = _read_varint(data, offset)
+        if tag in _ID_LISTS:
+            width = data[offset]
+            ids = array(_ID_TYPECODES[width], str(data[offset + 1:offset + 1 + n * width]))
+            if sys.byteorder == 'big':
+                ids.byteswap()
+            uuids = self.__uuids()
+            return [uuids[node_id] for node_id in ids]
+        if tag == _EXECUTION_COUNTS:
+            execution_counts = {}
+            for _ in xrange(n):
+                node_id, offset = _read_varint(data, offset)
+                execution_counts[node_list[node_id].uuid()], offset = _read_varint(data, offset)
+            return execution_counts
+        if tag == _WAITING_SINCE:
+            waiting_since = {}
+            for _ in xrange(n):
+                node_id, offset = _read_varint(data, offset)
+                count, offset = _read_varint(data, offset)
+                times = waiting_since[node_list[node_id].uuid()] = []
+                for _ in xrange(count):
+                    (started,) = _DEADLINE.unpack_from(buffer(data), offset)
+                    offset += _DEADLINE.size
+                    times.append(None if started != started else started)
+            return waiting_since
+        if tag == _TRACE_TOTALS:
+            trace_totals = {}
+            for key in _TRACES[:n]:
+                trace_totals[key], offset = _read_varint(data, offset)
+            return trace_totals
+        timers = []
+        for _ in xrange(n):
+            kind = _TIMER_KINDS[data[offset]]
+            node_id, offset = _read_varint(data, offset + 1)
+            (deadline,) = _DEADLINE.unpack_from(buffer(data), offset)
+            offset += _DEADLINE.size
+            timers.append([kind, node_list[node_id].uuid(), deadline])
+        return timers
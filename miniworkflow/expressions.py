@@ -0,0 +1,138 @@
+import ast
+import operator
+
+
+class ConditionSyntaxError(ValueError):
+    pass
+
+
+_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: b is not None and a in b,
+    ast.NotIn: lambda a, b: b is None or a not in b,
+}
+
+_CONSTANT_NAMES = {'True': True, 'False': False, 'None': None}
+
+
+def _lookup(variables, path):
+    value = variables
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return value
+
+
+class Condition(object):
+    """
+    Transition condition written as an expression over workflow variables,
+    usable wherever a condition callable is expected:
+
+        Transition(N1, Condition("foo.bar"))
+        Transition(END, Condition("not foo.bar and retries['os'] < 3"))
+
+    Names, attribute access and subscripts with literal keys read variable
+    paths (missing ones read as None); literals, comparisons, `in`, `and`,
+    `or`, `not` and unary minus are supported. The expression is compiled
+    once and records the paths it reads, so MiniWorkflow can memoize its
+    value until one of those variables is updated. Conditions pickle as their
+    source text, which makes specs using them shippable to other processes.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ConditionSyntaxError("%s: %s" % (source, e))
+        paths = set()
+        self.__evaluate = self.__compile(tree.body, paths)
+        self.paths = frozenset(paths)
+        self.roots = frozenset(path[0] for path in paths)
+
+    def evaluate(self, variables):
+        return bool(self.__evaluate(variables))
+
+    def __call__(self, workflow, node):
+        cache = workflow.condition_cache
+        try:
+            return cache[self]
+        except KeyError:
+            value = cache[self] = self.evaluate(workflow.workflow_variables)
+            return value
+
+    def __reduce__(self):
+        return Condition, (self.source,)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.source)
+
+    def __compile(self, node, paths):
+        if isinstance(node, ast.BoolOp):
+            operands = [self.__compile(value, paths) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda v: all(operand(v) for operand in operands)
+            return lambda v: any(operand(v) for operand in operands)
+        if isinstance(node, ast.UnaryOp):
+            operand = self.__compile(node.operand, paths)
+            if isinstance(node.op, ast.Not):
+                return lambda v: not operand(v)
+            if isinstance(node.op, ast.USub):
+                return lambda v: -operand(v)
+        if isinstance(node, ast.Compare):
+            return self.__compile_comparison(node, paths)
+        if isinstance(node, (ast.Tuple, ast.List)):
+            items = [self.__compile(item, paths) for item in node.elts]
+            return lambda v: tuple(item(v) for item in items)
+        constant = self.__constant(node)
+        if constant is not None:
+            value = constant[0]
+            return lambda v: value
+        path = self.__path(node)
+        if path is not None:
+            paths.add(path)
+            return lambda v: _lookup(v, path)
+        raise ConditionSyntaxError("%s: unsupported expression %s" % (self.source, ast.dump(node)))
+
+    def __compile_comparison(self, node, paths):
+        operands = [self.__compile(node.left, paths)] + [self.__compile(c, paths) for c in node.comparators]
+        try:
+            operators = [_COMPARISONS[type(op)] for op in node.ops]
+        except KeyError:
+            raise ConditionSyntaxError("%s: unsupported comparison" % self.source)
+
+        def compare(v):
+            values = [operand(v) for operand in operands]
+            return all(op(values[i], values[i + 1]) for i, op in enumerate(operators))
+
+        return compare
+
+    def __constant(self, node):
+        if isinstance(node, ast.Num):
+            return (node.n,)
+        if isinstance(node, ast.Str):
+            return (node.s,)
+        if isinstance(node, ast.Name) and node.id in _CONSTANT_NAMES:
+            return (_CONSTANT_NAMES[node.id],)
+        return None
+
+    def __path(self, node):
+        if isinstance(node, ast.Name):
+            return (node.id,)
+        if isinstance(node, ast.Attribute):
+            parent = self.__path(node.value)
+            return None if parent is None else parent + (node.attr,)
+        if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Index):
+            parent = self.__path(node.value)
+            key = self.__constant(node.slice.value)
+            if parent is None or key is None:
+                return None
+            return parent + (key[0],)
+        return None
@@ -0,0 +1,137 @@
+"""
+Graphviz export of workflow definitions, optionally with runtime data on top
+"""
+import re
+from collections import Counter, deque
+from miniworkflow import to_dot_record
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def dot_id(uuid):
+    if _IDENTIFIER.match(uuid):
+        return uuid
+    return '"%s"' % uuid.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class RuntimeOverlay(object):
+    """
+    Runtime data drawn over a definition: executions and waiting instances
+    per node uuid, and traversals per (source uuid, target uuid) edge. Feed
+    it one or many instances (live or as saved states) for a heatmap.
+    Without traversal counts, which only an Instrumentation records, an
+    edge is as hot as the colder of its two ends.
+    """
+
+    def __init__(self):
+        self.executions = Counter()
+        self.waiting = Counter()
+        self.edges = Counter()
+
+    def add_workflow(self, workflow):
+        self.executions.update(workflow.execution_counts)
+        self.waiting.update(workflow.waiting_list)
+        return self
+
+    def add_state(self, state):
+        self.executions.update(state.get('execution_counts') or Counter(state['executed_trace']))
+        self.waiting.update(state['waiting_list'])
+        return self
+
+    def add_instrumentation(self, instrumentation):
+        self.executions.update(instrumentation.counters.get('node_completions_total', {}))
+        self.edges.update(instrumentation.counters.get('transitions_taken_total', {}))
+        return self
+
+    def edge_heat(self, source, target):
+        if self.edges:
+            return self.edges[(source, target)]
+        return min(self.executions[source], self.executions[target])
+
+    def hottest(self):
+        """
+        (most executions of a node, most traversals of an edge)
+        """
+        hottest_node = max(self.executions.itervalues()) if self.executions else 0
+        hottest_edge = max(self.edges.itervalues()) if self.edges else hottest_node
+        return hottest_node, hottest_edge
+
+
+class DotWriter(object):
+    """
+    Streams the digraph reachable from a node to `out` as it walks it,
+    breadth first, without building it in memory. `max_depth` stops at
+    nodes that many transitions away from the root and `max_nodes` after
+    that many nodes; transitions to the nodes left out are not drawn.
+    With an `overlay`, nodes are shaded and labelled by executions,
+    waiting nodes outlined, and edges thickened by traversals.
+    """
+
+    # lines are handed to out.write in chunks of this many
+    chunk = 512
+
+    def __init__(self, out, name="Test", max_depth=None, max_nodes=None, overlay=None):
+        self.out = out
+        self.name = name
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.overlay = overlay
+
+    def write(self, root):
+        overlay = self.overlay
+        if overlay is not None:
+            self.__hottest_node, self.__hottest_edge = overlay.hottest()
+        lines = ["digraph %s {" % dot_id(self.name),
+                 " graph [rankdir = LR,ordering=out];\n",
+                 " node [shape=record];\n"]
+        depths = {root: 0}
+        ids = {root: dot_id(root.uuid())}
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            source = ids[node]
+            lines.append('%s [label="%s"%s] \n' % (source, to_dot_record(self.__label(node)),
+                                                     self.__node_attributes(node) if overlay else ''))
+            for transition in node.out_transitions:
+                target = transition.target_node
+                if target not in ids:
+                    if not self.__admits(depths[node] + 1, len(ids)):
+                        continue
+                    depths[target] = depths[node] + 1
+                    ids[target] = dot_id(target.uuid())
+                    queue.append(target)
+                lines.append("%s -> %s%s\n" % (source, ids[target],
+                                                 self.__edge_attributes(node, target) if overlay else ''))
+            if len(lines) >= self.chunk:
+                self.out.write("".join(lines))
+                lines = []
+        lines.append("}")
+        self.out.write("".join(lines))
+
+    def __admits(self, depth, nodes):
+        return ((self.max_depth is None or depth <= self.max_depth) and
+                (self.max_nodes is None or nodes < self.max_nodes))
+
+    def __label(self, node):
+        label = node.activation_policy.decorate_digraph_node([node.description])
+        if self.overlay is not None:
+            uuid = node.uuid()
+            label.append("runs: %d" % self.overlay.executions[uuid])
+            if self.overlay.waiting[uuid]:
+                label.append("waiting: %d" % self.overlay.waiting[uuid])
+        return label
+
+    def __node_attributes(self, node):
+        uuid = node.uuid()
+        attributes = ',style=filled,fillcolor="0.000 %.3f 1.000"' % self.__ratio(self.overlay.executions[uuid],
+                                                                               self.__hottest_node)
+        if self.overlay.waiting[uuid]:
+            attributes += ',color=orange,penwidth=3'
+        return attributes
+
+    def __edge_attributes(self, source, target):
+        heat = self.overlay.edge_heat(source.uuid(), target.uuid())
+        return ' [label="%d",penwidth=%.1f]' % (heat, 1 + 4 * self.__ratio(heat, self.__hottest_edge))
+
+    def __ratio(self, value, hottest):
+        return float(value) / hottest if hottest else 0.0
@@ -0,0 +1,127 @@
+import bisect
+import time
+from collections import Counter
+
+DEFAULT_BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 300.0, 3600.0)
+
+
+class Histogram(object):
+    """
+    Counts of observations per bucket, Prometheus style: bucket i holds the
+    values <= bounds[i], the last one everything above the last bound
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        [(upper bound, observations <= bound)], ending with ('+Inf', count)
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'buckets': [list(bucket) for bucket in self.cumulative()]}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Instrumentation(object):
+    """
+    Timings and counts collected from MiniWorkflow and EventProcessor when
+    one is passed as their `instrumentation` (or through WorkflowFactory):
+
+    - node_execute_seconds: MiniWorkflow.execute, decomposition included
+    - node_transitions_seconds: evaluating a completed node's transitions
+    - node_waiting_seconds: from a node starting to wait to its completion,
+      by the instance's clock; the start is part of the instance state, so
+      waits spanning a save and a reload are measured too
+    - event_process_seconds: EventProcessor.process, by event class
+    - node_activations_total, node_waits_total, node_completions_total
+    - transitions_taken_total: transitions whose condition held, by
+      (source, target) node uuids
+
+    Instances built without one pay a single `is None` check per hook.
+    Nodes run through run_parallel/run_async skip MiniWorkflow.execute, so
+    only their counts, transitions and waits are recorded.
+    """
+    LABELS = {'event_process_seconds': 'event', 'transitions_taken_total': ('source', 'target')}
+
+    def __init__(self, clock=time.time, bounds=DEFAULT_BOUNDS, prefix='miniworkflow_'):
+        self.clock = clock
+        self.bounds = bounds
+        self.prefix = prefix
+        self.reset()
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, label, seconds):
+        try:
+            histogram = self.histograms[name][label]
+        except KeyError:
+            histogram = self.histograms.setdefault(name, {})[label] = Histogram(self.bounds)
+        histogram.observe(seconds)
+
+    def count(self, name, label):
+        self.counters.setdefault(name, Counter())[label] += 1
+
+    def since(self, name, label, started):
+        self.observe(name, label, self.clock() - started)
+
+    def activated(self, workflow, node):
+        self.count('node_activations_total', node.uuid())
+
+    def waiting(self, workflow, node):
+        self.count('node_waits_total', node.uuid())
+
+    def completed(self, workflow, node):
+        self.count('node_completions_total', node.uuid())
+
+    def snapshot(self):
+        return {'counters': dict((name, dict(counter)) for name, counter in self.counters.iteritems()),
+                'histograms': dict((name, dict((label, h.snapshot()) for label, h in by_label.iteritems()))
+                                   for name, by_label in self.histograms.iteritems())}
+
+    def prometheus(self):
+        """
+        Everything collected, in the Prometheus text exposition format
+        """
+        lines = []
+        for name in sorted(self.counters):
+            metric = self.prefix + name
+            lines.append("# TYPE %s counter" % metric)
+            for label, value in sorted(self.counters[name].iteritems()):
+                lines.append('%s{%s} %d' % (metric, self.__labels(name, label), value))
+        for name in sorted(self.histograms):
+            metric = self.prefix + name
+            lines.append("# TYPE %s histogram" % metric)
+            for label, histogram in sorted(self.histograms[name].iteritems()):
+                labels = self.__labels(name, label)
+                for bound, total in histogram.cumulative():
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, bound, total))
+                lines.append('%s_sum{%s} %r' % (metric, labels, histogram.sum))
+                lines.append('%s_count{%s} %d' % (metric, labels, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def __labels(self, name, label):
+        names = self.LABELS.get(name, 'node')
+        if not isinstance(names, tuple):
+            names, label = (names,), (label,)
+        return ','.join('%s="%s"' % (n, _escape(value)) for n, value in zip(names, label))
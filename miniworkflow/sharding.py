@@ -0,0 +1,145 @@
+import logging
+import multiprocessing
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(workflow_id, shards):
+    """
+    Stable across processes and interpreter runs, unlike hash()
+    """
+    return (zlib.crc32(str(workflow_id)) & 0xffffffff) % shards
+
+
+class ShardFailed(Exception):
+    """
+    Worker processes died, or failed to build their EventProcessor, with
+    events still queued for them
+    """
+
+    def __init__(self, shards):
+        Exception.__init__(self, "shard worker died: %s" % ", ".join(str(shard) for shard in shards))
+        self.shards = shards
+
+
+def _serve(processor_factory, shard, shards, queue, processed, failed):
+    try:
+        processor = processor_factory(shard, shards)
+    except Exception:
+        logger.exception("shard %d failed to build its processor", shard)
+        return
+    while True:
+        event = queue.get()
+        try:
+            if event is None:
+                return
+            try:
+                processor.process(event)
+            except Exception:
+                with failed.get_lock():
+                    failed.value += 1
+                logger.exception("shard %d failed processing %r", shard, event)
+            with processed.get_lock():
+                processed.value += 1
+        finally:
+            queue.task_done()
+
+
+class ShardedEventProcessor(object):
+    """
+    Spreads EventProcessor.process over `shards` worker processes. Events are
+    routed by workflow id, so each worker owns a fixed slice of the workflows
+    and sees the events of any one workflow in submission order.
+
+    `processor_factory(shard, shards)` is called inside each worker to build
+    its EventProcessor, typically over that shard's slice of the store. Only
+    with a `shared_store`, one workflow base serving every shard, can the
+    pool be resize()d: per-shard stores would lose the workflows that move.
+
+    drain() and stop() raise ShardFailed when a worker died with events
+    still queued, instead of waiting for them forever.
+    """
+    # seconds between checks on the workers while draining
+    poll_interval = 0.01
+
+    def __init__(self, processor_factory, shards, shared_store=False):
+        self.processor_factory = processor_factory
+        self.shards = shards
+        self.shared_store = shared_store
+        self.__workers = []
+
+    def start(self):
+        assert not self.__workers, "already started"
+        for shard in range(self.shards):
+            queue = multiprocessing.JoinableQueue()
+            processed = multiprocessing.Value('l', 0)
+            failed = multiprocessing.Value('l', 0)
+            process = multiprocessing.Process(target=_serve, name="workflow-shard-%d" % shard,
+                                              args=(self.processor_factory, shard, self.shards, queue,
+                                                    processed, failed))
+            process.daemon = True
+            process.start()
+            self.__workers.append(_Shard(process, queue, processed, failed))
+
+    def process(self, event):
+        worker = self.__workers[shard_for(event.get_workflow_id(), self.shards)]
+        worker.submitted += 1
+        worker.queue.put(event)
+
+    def queue_depths(self):
+        return [worker.submitted - worker.processed.value for worker in self.__workers]
+
+    def stats(self):
+        return [{'shard': shard,
+                 'submitted': worker.submitted,
+                 'processed': worker.processed.value,
+                 'failed': worker.failed.value,
+                 'depth': worker.submitted - worker.processed.value}
+                for shard, worker in enumerate(self.__workers)]
+
+    def drain(self):
+        """
+        Block until every event submitted so far has been processed
+        """
+        pending = [shard for shard, worker in enumerate(self.__workers) if worker.pending()]
+        while pending:
+            dead = [shard for shard in pending if not self.__workers[shard].process.is_alive()]
+            if dead:
+                raise ShardFailed(dead)
+            time.sleep(self.poll_interval)
+            pending = [shard for shard in pending if self.__workers[shard].pending()]
+
+    def stop(self):
+        try:
+            self.drain()
+        finally:
+            alive = [worker for worker in self.__workers if worker.process.is_alive()]
+            for worker in alive:
+                worker.queue.put(None)
+            for worker in self.__workers:
+                worker.process.join()
+            self.__workers = []
+
+    def resize(self, shards):
+        """
+        Drain, then restart with a different number of shards
+        """
+        if not self.shared_store:
+            raise ValueError("resizing moves workflows between shards, it needs a shared_store")
+        self.stop()
+        self.shards = shards
+        self.start()
+
+
+class _Shard(object):
+    def __init__(self, process, queue, processed, failed):
+        self.process = process
+        self.queue = queue
+        self.processed = processed
+        self.failed = failed
+        self.submitted = 0
+
+    def pending(self):
+        return self.processed.value < self.submitted
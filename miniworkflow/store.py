@@ -0,0 +1,274 @@
+import sqlite3
+from collections import Counter, OrderedDict
+import simplejson
+from miniworkflow import WorkflowNotFound, StateChange
+
+
+def _dumps(o):
+    return simplejson.dumps(o, separators=(',', ':'))
+
+
+class SqliteWorkflowBase(object):
+    """
+    Workflow base persisted in a local SQLite file as one state snapshot per
+    workflow plus an append-only journal of the state changes made since.
+    Loading a workflow replays the journal tail on top of its snapshot; a new
+    snapshot is taken, and the journal compacted, every `snapshot_interval`
+    journal records so recovery time stays bounded.
+
+    It also maintains a (node uuid -> workflow ids) index of the nodes each
+    workflow is waiting on, fed by the journaled wait/complete changes.
+    """
+
+    def __init__(self, path, workflow_factory, snapshot_interval=100):
+        self.connection = sqlite3.connect(path)
+        self.workflow_factory = workflow_factory
+        self.snapshot_interval = snapshot_interval
+        self.__create_schema()
+
+    def __create_schema(self):
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS snapshots ("
+                                    " workflow_id PRIMARY KEY,"
+                                    " state TEXT NOT NULL,"
+                                    " journal_length INTEGER NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS journal ("
+                                    " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                                    " workflow_id NOT NULL,"
+                                    " record TEXT NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS journal_by_workflow"
+                                    " ON journal (workflow_id, seq)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS waiting ("
+                                    " node_uuid TEXT NOT NULL,"
+                                    " workflow_id NOT NULL,"
+                                    " count INTEGER NOT NULL,"
+                                    " PRIMARY KEY (node_uuid, workflow_id))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS waiting_by_workflow"
+                                    " ON waiting (workflow_id)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS timers ("
+                                    " workflow_id NOT NULL,"
+                                    " kind TEXT NOT NULL,"
+                                    " node_uuid TEXT NOT NULL,"
+                                    " deadline REAL NOT NULL,"
+                                    " PRIMARY KEY (workflow_id, kind, node_uuid))")
+
+    def get_workflow(self, workflow_id):
+        row = self.connection.execute("SELECT state FROM snapshots WHERE workflow_id = ?",
+                                      (workflow_id,)).fetchone()
+        if row is None:
+            raise WorkflowNotFound(workflow_id)
+        w = self.workflow_factory.create_instance()
+        w.set_state(simplejson.loads(row[0]))
+        w.replay(simplejson.loads(record) for (record,) in
+                 self.connection.execute("SELECT record FROM journal WHERE workflow_id = ? ORDER BY seq",
+                                         (workflow_id,)))
+        w.journal = []
+        return w
+
+    def add_workflow(self, workflow_id, w):
+        with self.connection:
+            self.__snapshot(workflow_id, w)
+        w.journal = []
+
+    def save_workflow(self, workflow_id, w):
+        if w.journal is None:
+            return self.add_workflow(workflow_id, w)
+        with self.connection:
+            self.__append_journal(workflow_id, w)
+
+    def __append_journal(self, workflow_id, w):
+        changes, w.journal = w.journal, []
+        if not changes:
+            return
+        self.connection.executemany("INSERT INTO journal (workflow_id, record) VALUES (?, ?)",
+                                    ((workflow_id, _dumps(change)) for change in changes))
+        self.connection.execute("UPDATE snapshots SET journal_length = journal_length + ?"
+                                " WHERE workflow_id = ?", (len(changes), workflow_id))
+        (journal_length,) = self.connection.execute(
+            "SELECT journal_length FROM snapshots WHERE workflow_id = ?", (workflow_id,)).fetchone()
+        if journal_length >= self.snapshot_interval:
+            self.__snapshot(workflow_id, w)
+        else:
+            self.__index_waiting(workflow_id, w, set(argument[0] if isinstance(argument, list) else argument
+                                                     for change, argument in changes
+                                                     if change in (StateChange.WAIT, StateChange.COMPLETE)))
+            self.__index_timers(workflow_id, w, set(tuple(timer[:2]) for change, timer in changes
+                                                    if change in (StateChange.SCHEDULE, StateChange.CANCEL)))
+
+    def __index_waiting(self, workflow_id, w, uuids):
+        for uuid in uuids:
+            waiting = w.waiting_list.count(uuid)
+            if waiting:
+                self.connection.execute("INSERT OR REPLACE INTO waiting (node_uuid, workflow_id, count)"
+                                        " VALUES (?, ?, ?)", (uuid, workflow_id, waiting))
+            else:
+                self.connection.execute("DELETE FROM waiting WHERE node_uuid = ? AND workflow_id = ?",
+                                        (uuid, workflow_id))
+
+    def __index_timers(self, workflow_id, w, keys):
+        for kind, uuid in keys:
+            deadline = w.timers.get((kind, uuid))
+            if deadline is not None:
+                self.connection.execute("INSERT OR REPLACE INTO timers (workflow_id, kind, node_uuid, deadline)"
+                                        " VALUES (?, ?, ?, ?)", (workflow_id, kind, uuid, deadline))
+            else:
+                self.connection.execute("DELETE FROM timers WHERE workflow_id = ? AND kind = ? AND node_uuid = ?",
+                                        (workflow_id, kind, uuid))
+
+    def tracked_timers(self):
+        """
+        (workflow id, {(kind, node uuid): deadline}) for every workflow with
+        pending timers, to rebuild a TimerQueue after a restart
+        """
+        by_workflow = OrderedDict()
+        for workflow_id, kind, uuid, deadline in self.connection.execute(
+                "SELECT workflow_id, kind, node_uuid, deadline FROM timers ORDER BY workflow_id"):
+            by_workflow.setdefault(workflow_id, {})[(kind, uuid)] = deadline
+        return by_workflow.items()
+
+    def waiting_on(self, node_uuid):
+        """
+        Ids of the workflows waiting on the node with uuid `node_uuid`
+        """
+        return [workflow_id for (workflow_id,) in
+                self.connection.execute("SELECT workflow_id FROM waiting WHERE node_uuid = ?", (node_uuid,))]
+
+    def count_waiting(self, node_uuid):
+        return self.connection.execute("SELECT COUNT(*) FROM waiting WHERE node_uuid = ?",
+                                       (node_uuid,)).fetchone()[0]
+
+    def complete_waiting(self, node_uuid, data, skip=None):
+        """
+        Complete `node_uuid` in every workflow waiting on it, except those
+        for which `skip(workflow_id)` holds, in one transaction. Returns the
+        advanced instances by workflow id. Go through
+        EventProcessor.complete_waiting to have their timers tracked and the
+        completion deduplicated.
+        """
+        completed = OrderedDict()
+        with self.connection:
+            for workflow_id in self.waiting_on(node_uuid):
+                if skip is not None and skip(workflow_id):
+                    continue
+                w = self.get_workflow(workflow_id)
+                w.complete_by_uuid(node_uuid, data)
+                w.run()
+                self.__append_journal(workflow_id, w)
+                completed[workflow_id] = w
+        return completed
+
+    def journal_length(self, workflow_id):
+        row = self.connection.execute("SELECT journal_length FROM snapshots WHERE workflow_id = ?",
+                                      (workflow_id,)).fetchone()
+        if row is None:
+            raise WorkflowNotFound(workflow_id)
+        return row[0]
+
+    def compact(self, workflow_id):
+        self.add_workflow(workflow_id, self.get_workflow(workflow_id))
+
+    def __snapshot(self, workflow_id, w):
+        self.connection.execute("INSERT OR REPLACE INTO snapshots (workflow_id, state, journal_length)"
+                                " VALUES (?, ?, 0)", (workflow_id, _dumps(w.get_state())))
+        self.connection.execute("DELETE FROM journal WHERE workflow_id = ?", (workflow_id,))
+        self.connection.execute("DELETE FROM waiting WHERE workflow_id = ?", (workflow_id,))
+        self.connection.executemany("INSERT INTO waiting (node_uuid, workflow_id, count) VALUES (?, ?, ?)",
+                                    ((uuid, workflow_id, waiting)
+                                     for uuid, waiting in Counter(w.waiting_list).iteritems()))
+        self.connection.execute("DELETE FROM timers WHERE workflow_id = ?", (workflow_id,))
+        self.connection.executemany("INSERT INTO timers (workflow_id, kind, node_uuid, deadline) VALUES (?, ?, ?, ?)",
+                                    ((workflow_id, kind, uuid, deadline)
+                                     for (kind, uuid), deadline in w.timers.iteritems()))
+
+    def close(self):
+        self.connection.close()
+
+
+class CachedWorkflowBase(object):
+    """
+    Bounded LRU cache of live instances in front of another workflow base.
+    Once more than `capacity` instances are live, the least recently used
+    ones that are only waiting (no active nodes) are saved to the backing
+    base and dropped; they are rehydrated from it on the next lookup. If
+    that is not enough, instances with active nodes are hibernated too,
+    least recently used first; the most recently used one never is.
+    """
+
+    def __init__(self, workflow_base, capacity):
+        self.workflow_base = workflow_base
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__live = OrderedDict()
+
+    def get_workflow(self, workflow_id):
+        try:
+            w = self.__live.pop(workflow_id)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            w = self.workflow_base.get_workflow(workflow_id)
+        self.__live[workflow_id] = w
+        self.__evict()
+        return w
+
+    def add_workflow(self, workflow_id, w):
+        self.workflow_base.add_workflow(workflow_id, w)
+        self.__live.pop(workflow_id, None)
+        self.__live[workflow_id] = w
+        self.__evict()
+
+    def save_workflow(self, workflow_id, w):
+        self.workflow_base.save_workflow(workflow_id, w)
+
+    def waiting_on(self, node_uuid):
+        return self.workflow_base.waiting_on(node_uuid)
+
+    def count_waiting(self, node_uuid):
+        return self.workflow_base.count_waiting(node_uuid)
+
+    def tracked_timers(self):
+        return self.workflow_base.tracked_timers()
+
+    def complete_waiting(self, node_uuid, data, skip=None):
+        # live copies would go stale, so hand them back before the bulk update
+        for workflow_id in self.waiting_on(node_uuid):
+            w = self.__live.pop(workflow_id, None)
+            if w is not None:
+                self.workflow_base.save_workflow(workflow_id, w)
+        return self.workflow_base.complete_waiting(node_uuid, data, skip)
+
+    def __len__(self):
+        return len(self.__live)
+
+    def __contains__(self, workflow_id):
+        return workflow_id in self.__live
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'live': len(self.__live), 'capacity': self.capacity}
+
+    def __evict(self):
+        overflow = len(self.__live) - self.capacity
+        if overflow <= 0:
+            return
+        # the most recently used instance is the one the caller holds right now
+        newest = next(reversed(self.__live))
+        victims = []
+        for workflow_id, w in self.__live.iteritems():
+            if len(victims) == overflow or workflow_id == newest:
+                break
+            if len(w.active_nodes) == 0:
+                victims.append((workflow_id, w))
+        if len(victims) < overflow:
+            quiescent = set(workflow_id for workflow_id, _ in victims)
+            for workflow_id, w in self.__live.iteritems():
+                if len(victims) == overflow or workflow_id == newest:
+                    break
+                if workflow_id not in quiescent:
+                    victims.append((workflow_id, w))
+        for workflow_id, w in victims:
+            self.workflow_base.save_workflow(workflow_id, w)
+            del self.__live[workflow_id]
+            self.evictions += 1
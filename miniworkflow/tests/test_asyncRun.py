@@ -0,0 +1,78 @@
+import time
+from unittest import TestCase, skipIf
+from hamcrest import assert_that, equal_to, less_than
+from miniworkflow import Node, Transition, MiniWorkflow, TaskResult, WorkflowFactory, EventProcessor, \
+    EmailReceivedEvent, WaitForExternalEvent
+from miniworkflow.tests.test_doubles.workflow_base_double import WorkflowBaseDouble
+
+try:
+    from miniworkflow.aio import asyncio
+except ImportError:
+    asyncio = None
+
+
+class DelayedExternalProcess(object):
+    """
+    Resolves to COMPLETED after `delay` seconds without blocking the loop
+    """
+
+    def __init__(self, loop, delay):
+        self.loop = loop
+        self.delay = delay
+        self.calls = 0
+
+    def get_instance(self):
+        return self
+
+    def execute(self, node, workflow):
+        self.calls += 1
+        result = asyncio.Future(loop=self.loop)
+        self.loop.call_later(self.delay, result.set_result, TaskResult.COMPLETED)
+        return result
+
+
+@skipIf(asyncio is None, "needs asyncio or trollius")
+class TestAsyncRun(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def build_chain(self, delay):
+        self.external_process = DelayedExternalProcess(self.loop, delay)
+        start = Node("start")
+        call = Node("call")
+        call.set_decomposition_factory(self.external_process)
+        wait = Node("wait")
+        wait.set_decomposition_factory(WaitForExternalEvent())
+        start.connect(Transition(call))
+        call.connect(Transition(wait))
+        wait.connect(Transition(Node("end")))
+        return start
+
+    def test_produces_the_same_trace_as_run(self):
+        start = self.build_chain(0)
+        w = MiniWorkflow(start)
+        self.loop.run_until_complete(w.run_async(loop=self.loop))
+        assert_that(w.executed_trace, equal_to(['start', 'call']))
+        assert_that(list(w.waiting_list), equal_to(['wait']))
+
+    def test_multiplexes_outstanding_calls_on_one_loop(self):
+        start = self.build_chain(0.05)
+        workflows = [MiniWorkflow(start) for _ in range(200)]
+        started = time.time()
+        self.loop.run_until_complete(asyncio.gather(*[w.run_async(loop=self.loop) for w in workflows],
+                                                    loop=self.loop))
+        assert_that(time.time() - started, less_than(1))
+        assert_that(self.external_process.calls, equal_to(200))
+
+    def test_processes_events_for_one_workflow_in_order(self):
+        workflow_base = WorkflowBaseDouble({})
+        processor = EventProcessor(workflow_base, WorkflowFactory(self.build_chain(0.01)))
+        first = processor.process_async(EmailReceivedEvent(1, 'wait'), loop=self.loop)
+        second = processor.process_async(EmailReceivedEvent(1, 'wait'), loop=self.loop)
+        self.loop.run_until_complete(asyncio.gather(first, second, loop=self.loop))
+        assert_that(self.external_process.calls, equal_to(1))
+        assert_that(workflow_base.get_workflow(1).executed_trace.count('end'), equal_to(2))
+        assert_that(processor.in_flight, equal_to({}))
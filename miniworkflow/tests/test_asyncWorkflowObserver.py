@@ -0,0 +1,72 @@
+import threading
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_length
+from miniworkflow import Node, Transition, MiniWorkflow, WorkflowEvent, WaitForExternalEvent
+from miniworkflow.dispatch import AsyncWorkflowObserver, EventDispatcher, DispatchPolicy
+
+
+class Recorder(object):
+    def __init__(self, gate=None):
+        self.seen = []
+        self.gate = gate
+
+    def notify(self, event, node):
+        if self.gate is not None:
+            self.gate.wait()
+        self.seen.append((event, node.uuid()))
+
+
+class TestAsyncWorkflowObserver(TestCase):
+    def setUp(self):
+        self.dispatcher = EventDispatcher(lanes=2)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+
+    def build_workflow(self):
+        start = Node("start")
+        wait = Node("wait")
+        wait.set_decomposition_factory(WaitForExternalEvent())
+        start.connect(Transition(wait))
+        w = MiniWorkflow(start)
+        w.observer = AsyncWorkflowObserver(self.dispatcher)
+        return w
+
+    def subscribe(self, w, recorder):
+        for event in (WorkflowEvent.NODE_SET_ACTIVE, WorkflowEvent.NODE_EXECUTE,
+                      WorkflowEvent.NODE_WAIT, WorkflowEvent.NODE_COMPLETED):
+            w.observer.subscribe(event, recorder)
+
+    def test_delivers_the_full_lifecycle_in_order(self):
+        w = self.build_workflow()
+        recorder = Recorder()
+        self.subscribe(w, recorder)
+        w.run()
+        w.observer.flush()
+        assert_that(recorder.seen, equal_to([
+            (WorkflowEvent.NODE_EXECUTE, "start"),
+            (WorkflowEvent.NODE_COMPLETED, "start"),
+            (WorkflowEvent.NODE_SET_ACTIVE, "wait"),
+            (WorkflowEvent.NODE_EXECUTE, "wait"),
+            (WorkflowEvent.NODE_WAIT, "wait")]))
+
+    def test_slow_subscribers_do_not_stall_the_engine(self):
+        w = self.build_workflow()
+        gate = threading.Event()
+        recorder = Recorder(gate)
+        self.subscribe(w, recorder)
+        w.run()
+        assert_that(w.waiting_list, has_length(1))
+        gate.set()
+        w.get_state()
+        assert_that(recorder.seen, has_length(5))
+
+    def test_drop_policy_counts_overflowing_events(self):
+        self.dispatcher = EventDispatcher(max_pending=1, policy=DispatchPolicy.DROP)
+        w = self.build_workflow()
+        gate = threading.Event()
+        self.subscribe(w, Recorder(gate))
+        w.run()
+        gate.set()
+        w.observer.flush()
+        assert_that(self.dispatcher.dropped > 0, equal_to(True))
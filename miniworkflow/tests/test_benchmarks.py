@@ -0,0 +1,26 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_key, greater_than
+from miniworkflow.benchmarks import run_benchmarks, compare, registry
+
+
+def results(**bests):
+    return {'benchmarks': dict((name, {'best': best}) for name, best in bests.items())}
+
+
+class TestBenchmarks(TestCase):
+    def test_every_benchmark_runs(self):
+        report = run_benchmarks(scale=0.01, repeat=1)
+        assert_that(report['benchmarks'].keys(), equal_to(registry.keys()))
+        for result in report['benchmarks'].values():
+            assert_that(result['operations'], greater_than(0))
+
+    def test_runs_only_the_named_benchmarks(self):
+        report = run_benchmarks(['run_deep_chain'], scale=0.01, repeat=1)
+        assert_that(report['benchmarks'].keys(), equal_to(['run_deep_chain']))
+        assert_that(report, has_key('python'))
+        assert_that(report['memory']['bytes_per_node'], greater_than(0))
+
+    def test_flags_slowdowns_beyond_the_tolerance(self):
+        rows = compare(results(a=1.1, b=1.5, c=1.0), results(a=1.0, b=1.0), tolerance=0.2)
+        assert_that(sorted((name, regressed) for name, _, _, _, regressed in rows),
+                    equal_to([('a', False), ('b', True)]))
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_entries
+from miniworkflow import WorkflowFactory, EventProcessor, EmailReceivedEvent
+from miniworkflow.store import SqliteWorkflowBase, CachedWorkflowBase
+from miniworkflow.tests.test_interfaces.test_workflowBaseInterface import WorkflowBaseInterfaceTest
+from miniworkflow.tests.test_sqliteWorkflowBase import build_mail_loop
+
+
+class TestCachedWorkflowBase(TestCase, WorkflowBaseInterfaceTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.factory = WorkflowFactory(build_mail_loop())
+        self.store = SqliteWorkflowBase(os.path.join(self.directory, "workflows.db"), self.factory)
+        self.object = CachedWorkflowBase(self.store, capacity=2)
+        self.processor = EventProcessor(self.object, self.factory)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_hibernates_least_recently_used_waiting_instances(self):
+        for workflow_id in range(5):
+            self.processor.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+        assert_that(len(self.object), equal_to(2))
+        assert_that(0 in self.object, equal_to(False))
+        assert_that(self.object.stats(), has_entries(evictions=3, misses=5))
+
+    def test_rehydrates_evicted_instances_on_demand(self):
+        for workflow_id in range(3):
+            self.processor.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+        self.processor.process(EmailReceivedEvent(0, "wait_for_mail"))
+        w = self.object.get_workflow(0)
+        assert_that(w.execution_counts['process_mail'], equal_to(2))
+        assert_that(self.object.stats(), has_entries(hits=1))
+
+    def test_evicts_waiting_instances_before_active_ones(self):
+        busy = self.factory.create_instance()
+        self.object.add_workflow('busy', busy)
+        for workflow_id in range(3):
+            self.processor.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+        assert_that('busy' in self.object, equal_to(True))
+
+    def test_evicts_active_instances_oldest_first_when_none_is_waiting(self):
+        for workflow_id in range(4):
+            self.object.add_workflow(workflow_id, self.factory.create_instance())
+        assert_that(len(self.object), equal_to(2))
+        assert_that([workflow_id in self.object for workflow_id in range(4)],
+                    equal_to([False, False, True, True]))
+        w = self.object.get_workflow(0)
+        assert_that(list(w.active_nodes), equal_to(['start']))
+        w.run()
+        assert_that(list(w.waiting_list), equal_to(['wait_for_mail']))
+
+    def test_bulk_completion_includes_live_instances(self):
+        for workflow_id in range(3):
+            self.processor.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+        assert_that(self.object.count_waiting("wait_for_mail"), equal_to(3))
+        self.object.complete_waiting("wait_for_mail", None)
+        for workflow_id in range(3):
+            w = self.object.get_workflow(workflow_id)
+            assert_that(w.execution_counts['process_mail'], equal_to(2))
@@ -0,0 +1,84 @@
+from unittest import TestCase, skipIf
+from hamcrest import assert_that, equal_to
+from miniworkflow import Node, Transition, AndActivationPolicy, WorkflowFactory, WaitForExternalEvent, TaskResult
+from miniworkflow.expressions import Condition
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class CountDown(object):
+    def get_instance(self):
+        return self
+
+    def execute(self, node, workflow):
+        workflow.update_workflow_variables({'left': workflow.workflow_variables['left'] - 1})
+        return TaskResult.COMPLETED
+
+
+def build_join_loop():
+    """
+    START -> N1, N2 -> AND -> N3 (counts down) -> N1 while left > 0, else END
+    """
+    start = Node("START")
+    n1 = Node("N1")
+    n2 = Node("N2")
+    n_and = Node("AND", activation_policy=AndActivationPolicy())
+    n3 = Node("N3")
+    end = Node("END")
+    n3.set_decomposition_factory(CountDown())
+    start.connect(Transition(n1))
+    start.connect(Transition(n2))
+    n1.connect(Transition(n_and))
+    n2.connect(Transition(n_and))
+    n_and.connect(Transition(n3))
+    n3.connect(Transition(n1, Condition("left > 0")))
+    n3.connect(Transition(end, Condition("left <= 0")))
+    return start
+
+
+@skipIf(numpy is None, "needs numpy")
+class TestCohort(TestCase):
+    def setUp(self):
+        self.factory = WorkflowFactory(build_join_loop())
+
+    def test_matches_stepping_instances_one_by_one(self):
+        cohort = self.factory.create_cohort(3, {'left': 1})
+        cohort.update_workflow_variables(1, {'left': 2})
+        cohort.update_workflow_variables(2, {'left': 3})
+        cohort.run()
+        for i, left in enumerate([1, 2, 3]):
+            w = self.factory.create_instance()
+            w.update_workflow_variables({'left': left})
+            w.run()
+            assert_that(cohort.get_state(i)['execution_counts'], equal_to(dict(w.execution_counts)))
+        assert_that(list(cohort.finished()), equal_to([0, 1, 2]))
+
+    def test_waiting_instances_are_completed_together(self):
+        start = Node("start")
+        wait = Node("wait")
+        end = Node("end")
+        wait.set_decomposition_factory(WaitForExternalEvent())
+        start.connect(Transition(wait))
+        wait.connect(Transition(end))
+        cohort = WorkflowFactory(start).create_cohort(4)
+        cohort.run()
+        assert_that(cohort.count_waiting('wait'), equal_to(4))
+        assert_that(list(cohort.finished()), equal_to([0, 1, 2, 3]))
+        cohort.complete_by_uuid(2, 'wait', None)
+        cohort.run()
+        assert_that(cohort.count_waiting('wait'), equal_to(3))
+        assert_that(list(cohort.complete_waiting('wait', None)), equal_to([0, 1, 3]))
+        cohort.run()
+        assert_that(cohort.executed[:, 2].tolist(), equal_to([1, 1, 1, 1]))
+
+    def test_exported_instances_can_continue_on_their_own(self):
+        cohort = self.factory.create_cohort(2, {'left': 2})
+        cohort.step()
+        w = self.factory.create_instance()
+        w.set_state(cohort.get_state(1))
+        w.run()
+        cohort.run()
+        assert_that(dict(w.execution_counts), equal_to(cohort.get_state(1)['execution_counts']))
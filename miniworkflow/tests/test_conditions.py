@@ -0,0 +1,62 @@
+import pickle
+from unittest import TestCase
+from hamcrest import assert_that, equal_to
+from miniworkflow import Node, Transition, MiniWorkflow, AndActivationPolicy, WorkflowSpec
+from miniworkflow.expressions import Condition, ConditionSyntaxError
+from miniworkflow.tests.test_doubles.external_process_double import ExternalProcessDouble
+
+
+class CountingCondition(Condition):
+    evaluations = 0
+
+    def evaluate(self, variables):
+        CountingCondition.evaluations += 1
+        return super(CountingCondition, self).evaluate(variables)
+
+
+class TestConditions(TestCase):
+    def test_reads_variable_paths(self):
+        condition = Condition("foo.bar and not retries['os'] > 2")
+        assert_that(condition.paths, equal_to(frozenset([('foo', 'bar'), ('retries', 'os')])))
+        assert_that(condition.evaluate({'foo': {'bar': True}, 'retries': {'os': 1}}), equal_to(True))
+        assert_that(condition.evaluate({'foo': {'bar': True}, 'retries': {'os': 3}}), equal_to(False))
+
+    def test_missing_variables_read_as_none(self):
+        assert_that(Condition("foo.bar == None").evaluate({}), equal_to(True))
+        assert_that(Condition("status in ('open', 'reopened')").evaluate({'status': 'open'}), equal_to(True))
+
+    def test_rejects_anything_but_the_expression_language(self):
+        self.assertRaises(ConditionSyntaxError, Condition, "__import__('os')")
+        self.assertRaises(ConditionSyntaxError, Condition, "foo +")
+
+    def test_memoizes_until_a_read_variable_changes(self):
+        CountingCondition.evaluations = 0
+        external_process = ExternalProcessDouble()
+        external_process.response = {'unrelated': 1}
+        start = Node("start")
+        loop = Node("loop")
+        loop.set_decomposition_factory(external_process)
+        start.connect(Transition(loop))
+        loop.connect(Transition(loop, CountingCondition("foo.bar")))
+        w = MiniWorkflow(start, workflow_variables={'foo': {'bar': True}})
+        w.run(5)
+        assert_that(w.execution_counts['loop'], equal_to(4))
+        assert_that(CountingCondition.evaluations, equal_to(1))
+        w.update_workflow_variables({'foo': {'bar': False}})
+        w.run()
+        assert_that(w.execution_counts['loop'], equal_to(5))
+        assert_that(CountingCondition.evaluations, equal_to(2))
+
+    def test_specs_with_declarative_conditions_can_be_pickled(self):
+        start = Node("START")
+        n1 = Node("N1")
+        n_and = Node("AND", activation_policy=AndActivationPolicy())
+        end = Node("END")
+        start.connect(Transition(n1))
+        n1.connect(Transition(n_and))
+        n_and.connect(Transition(n1, Condition("foo.bar")))
+        n_and.connect(Transition(end, Condition("not foo.bar")))
+        spec = pickle.loads(pickle.dumps(WorkflowSpec(start), pickle.HIGHEST_PROTOCOL))
+        w = MiniWorkflow(spec.start_node, workflow_variables={'foo': {'bar': False}}, spec=spec)
+        w.run()
+        assert_that(w.executed_trace, equal_to(['START', 'N1', 'AND', 'END']))
@@ -0,0 +1,44 @@
+import threading
+
+
+class FakeBroker(object):
+    """
+    In-process stand-in for a pika BlockingConnection factory: records what
+    is published and how many connections were opened. The next `failures`
+    connection attempts raise IOError.
+    """
+
+    def __init__(self):
+        self.published = []
+        self.connections = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise IOError("broker unavailable")
+            self.connections += 1
+        return FakeConnection(self)
+
+
+class FakeConnection(object):
+    def __init__(self, broker):
+        self.broker = broker
+        self.closed = False
+
+    def channel(self):
+        return FakeChannel(self.broker)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeChannel(object):
+    def __init__(self, broker):
+        self.broker = broker
+
+    def basic_publish(self, exchange, routing_key, body):
+        with self.broker.lock:
+            self.broker.published.append((exchange, routing_key, body))
@@ -0,0 +1,13 @@
+class FakeClock(object):
+    """
+    Callable stand-in for time.time that only moves when told to
+    """
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
@@ -11,4 +11,7 @@ class WorkflowBaseDouble(object):
             raise WorkflowNotFound(workflow_id)
 
     def add_workflow(self, workflow_id, w):
-        self.workflow_dict[workflow_id] = w
\ No newline at end of file
+        self.workflow_dict[workflow_id] = w
+
+    def save_workflow(self, workflow_id, w):
+        pass
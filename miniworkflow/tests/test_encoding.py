@@ -0,0 +1,119 @@
+import simplejson
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, less_than, has_length
+from miniworkflow import Node, Transition, MiniWorkflow, WorkflowFactory, WorkflowSpec, EventProcessor, \
+    EmailReceivedEvent, TaskResult, WaitForExternalEvent
+from miniworkflow.encoding import encode_workflow, encode_state, decode_state
+from miniworkflow.tests.test_doubles.fake_clock import FakeClock
+from miniworkflow.tests.test_doubles.workflow_base_double import WorkflowBaseDouble
+from miniworkflow.tests.test_sqliteWorkflowBase import build_mail_loop
+from miniworkflow.tests.test_timers import build_reminder_flow
+
+
+class CountingDecomposition(object):
+    def __init__(self):
+        self.calls = 0
+
+    def get_instance(self):
+        return self
+
+    def execute(self, node, workflow):
+        self.calls += 1
+        workflow.update_workflow_variables({'calls': self.calls})
+        return TaskResult.COMPLETED
+
+
+class TestEncoding(TestCase):
+    def setUp(self):
+        self.factory = WorkflowFactory(build_mail_loop())
+        self.workflow_base = WorkflowBaseDouble({})
+        processor = EventProcessor(self.workflow_base, self.factory)
+        for _ in range(20):
+            processor.process(EmailReceivedEvent(1, 'wait_for_mail'))
+        self.w = self.workflow_base.get_workflow(1)
+        self.w.update_workflow_variables({'customer': {'name': 'ACME', 'tickets': [1, 2]}})
+
+    def test_round_trips_through_set_state(self):
+        resumed = self.factory.create_instance()
+        resumed.set_state(decode_state(encode_workflow(self.w), self.factory.spec))
+        assert_that(resumed.get_state(), equal_to(self.w.get_state()))
+
+    def test_encodes_saved_states_too(self):
+        state = self.w.get_state()
+        assert_that(dict(decode_state(encode_state(state, self.factory.spec), self.factory.spec)), equal_to(state))
+
+    def test_is_much_smaller_than_json(self):
+        encoded = encode_workflow(self.w)
+        assert_that(len(encoded) * 3, less_than(len(simplejson.dumps(self.w.get_state()))))
+
+    def test_round_trips_timers(self):
+        clock = FakeClock()
+        factory = WorkflowFactory(build_reminder_flow(), clock=clock)
+        w = factory.create_instance()
+        w.run()
+        state = decode_state(encode_workflow(w), factory.spec)
+        assert_that(state['timers'], equal_to(w.get_state()['timers']))
+
+    def test_decodes_lazily(self):
+        state = decode_state(encode_workflow(self.w), self.factory.spec)
+        assert_that(state['waiting_list'], equal_to(['wait_for_mail']))
+        assert_that(state.decoded(), equal_to(set(['waiting_list'])))
+
+    def test_rejects_states_of_another_spec_or_a_newer_version(self):
+        encoded = encode_workflow(self.w)
+        self.assertRaises(ValueError, decode_state, encoded, WorkflowSpec(Node("other")))
+        self.assertRaises(ValueError, decode_state, encoded[:3] + chr(99) + encoded[4:], self.factory.spec)
+
+    def test_rejects_states_of_a_spec_with_the_same_nodes_rewired(self):
+        start, middle, end = Node("start"), Node("middle"), Node("end")
+        start.connect(Transition(middle))
+        middle.connect(Transition(end))
+        w = MiniWorkflow(start)
+        w.run()
+        rewired_start, rewired_middle, rewired_end = Node("start"), Node("middle"), Node("end")
+        rewired_start.connect(Transition(rewired_middle))
+        rewired_start.connect(Transition(rewired_end))
+        rewired = WorkflowSpec(rewired_start)
+        assert_that([node.uuid() for node in rewired.node_list], equal_to([node.uuid() for node in w.spec.node_list]))
+        self.assertRaises(ValueError, decode_state, encode_workflow(w), rewired)
+
+
+class TestBulkInstantiation(TestCase):
+    def setUp(self):
+        self.decomposition = CountingDecomposition()
+        start = Node("start")
+        prepare = Node("prepare")
+        prepare.set_decomposition_factory(self.decomposition)
+        wait_for_mail = Node("wait_for_mail")
+        wait_for_mail.set_decomposition_factory(WaitForExternalEvent())
+        process_mail = Node("process_mail")
+        start.connect(Transition(prepare))
+        prepare.connect(Transition(wait_for_mail))
+        wait_for_mail.connect(Transition(process_mail))
+        self.factory = WorkflowFactory(start)
+
+    def test_instances_share_the_prefix_up_to_the_first_wait(self):
+        instances = self.factory.create_instances(100)
+        assert_that(instances, has_length(100))
+        assert_that(self.decomposition.calls, equal_to(1))
+        for w in instances:
+            assert_that(list(w.waiting_list), equal_to(['wait_for_mail']))
+            assert_that(w.executed_trace, equal_to(['start', 'prepare']))
+
+    def test_instances_evolve_independently(self):
+        first, second = self.factory.create_instances(2)
+        first.complete_by_uuid('wait_for_mail', None)
+        first.update_workflow_variables({'calls': 5})
+        first.run()
+        assert_that(first.execution_counts['process_mail'], equal_to(1))
+        assert_that(second.execution_counts['process_mail'], equal_to(0))
+        assert_that(second.workflow_variables['calls'], equal_to(1))
+
+    def test_prefix_can_run_per_instance(self):
+        self.factory.create_instances(3, share_prefix=False)
+        assert_that(self.decomposition.calls, equal_to(3))
+
+    def test_event_processor_creates_workflows_in_bulk(self):
+        workflow_base = WorkflowBaseDouble({})
+        EventProcessor(workflow_base, self.factory).create_workflows(range(10))
+        assert_that(sorted(workflow_base.workflow_dict), equal_to(range(10)))
@@ -0,0 +1,45 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to
+from miniworkflow import WorkflowFactory, EventProcessor, EmailReceivedEvent
+from miniworkflow.tests.test_doubles.fake_clock import FakeClock
+from miniworkflow.tests.test_doubles.workflow_base_double import WorkflowBaseDouble
+from miniworkflow.tests.test_sqliteWorkflowBase import build_mail_loop
+
+
+class CountingWorkflowBase(WorkflowBaseDouble):
+    def __init__(self, workflow_dict):
+        super(CountingWorkflowBase, self).__init__(workflow_dict)
+        self.loads = 0
+        self.saves = 0
+
+    def get_workflow(self, workflow_id):
+        self.loads += 1
+        return super(CountingWorkflowBase, self).get_workflow(workflow_id)
+
+    def save_workflow(self, workflow_id, w):
+        self.saves += 1
+
+
+class TestEventBatching(TestCase):
+    def setUp(self):
+        # states carry wait start times, the same clock makes them comparable
+        self.factory = WorkflowFactory(build_mail_loop(), clock=FakeClock())
+        self.events = [EmailReceivedEvent(workflow_id, "wait_for_mail")
+                       for _ in range(5) for workflow_id in (1, 2, 3)]
+
+    def test_batch_ends_in_the_same_state_as_sequential_processing(self):
+        sequential = WorkflowBaseDouble({})
+        processor = EventProcessor(sequential, self.factory)
+        for event in self.events:
+            processor.process(event)
+        batched = WorkflowBaseDouble({})
+        EventProcessor(batched, self.factory).process_batch(self.events)
+        for workflow_id in (1, 2, 3):
+            assert_that(batched.get_workflow(workflow_id).get_state(),
+                        equal_to(sequential.get_workflow(workflow_id).get_state()))
+
+    def test_loads_and_saves_each_workflow_once(self):
+        workflow_base = CountingWorkflowBase({})
+        EventProcessor(workflow_base, self.factory).process_batch(self.events)
+        assert_that(workflow_base.loads, equal_to(3))
+        assert_that(workflow_base.saves, equal_to(3))
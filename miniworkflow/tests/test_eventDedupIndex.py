@@ -0,0 +1,97 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to
+from miniworkflow import WorkflowFactory, EventProcessor, EmailReceivedEvent
+from miniworkflow.dedup import EventDedupIndex
+from miniworkflow.tests.test_doubles.fake_clock import FakeClock
+from miniworkflow.tests.test_eventBatching import CountingWorkflowBase
+from miniworkflow.store import SqliteWorkflowBase
+from miniworkflow.tests.test_sqliteWorkflowBase import build_mail_loop
+from miniworkflow.tests.test_specAnalysis import build_reopen_flow
+
+
+class FailingWorkflowBase(CountingWorkflowBase):
+    failing = True
+
+    def save_workflow(self, workflow_id, workflow_instance):
+        if self.failing:
+            raise IOError("store unavailable")
+        super(FailingWorkflowBase, self).save_workflow(workflow_id, workflow_instance)
+
+
+class TestEventDedupIndex(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_forgets_the_oldest_ids_beyond_capacity(self):
+        index = EventDedupIndex(capacity=2, clock=self.clock)
+        for event_id in ('a', 'b', 'c'):
+            index.add(1, event_id)
+        assert_that(index.seen(1, 'a'), equal_to(False))
+        assert_that(index.seen(1, 'c'), equal_to(True))
+        assert_that(index.seen(2, 'c'), equal_to(False))
+
+    def test_forgets_ids_outside_the_window(self):
+        index = EventDedupIndex(window=60, clock=self.clock)
+        index.add(1, 'a')
+        self.clock.advance(30)
+        index.add(1, 'b')
+        self.clock.advance(31)
+        assert_that(index.seen(1, 'a'), equal_to(False))
+        assert_that(index.seen(1, 'b'), equal_to(True))
+
+    def test_forgets_the_least_recently_added_to_workflows_beyond_max_workflows(self):
+        index = EventDedupIndex(max_workflows=2, clock=self.clock)
+        index.add(1, 'a')
+        index.add(2, 'b')
+        index.add(1, 'c')
+        index.add(3, 'd')
+        assert_that([index.seen(1, 'a'), index.seen(2, 'b'), index.seen(3, 'd')], equal_to([True, False, True]))
+
+    def test_processor_forgets_finished_workflows(self):
+        workflow_base = CountingWorkflowBase({})
+        index = EventDedupIndex()
+        processor = EventProcessor(workflow_base, WorkflowFactory(build_reopen_flow()), index)
+        processor.process(EmailReceivedEvent(1, 'wait_for_target_mail', event_id='m1'))
+        processor.process(EmailReceivedEvent(2, 'wait_for_imp_mail', event_id='m2'))
+        assert_that(workflow_base.get_workflow(1).is_finished(), equal_to(True))
+        assert_that([index.seen(1, 'm1'), index.seen(2, 'm2')], equal_to([False, True]))
+        assert_that(len(index), equal_to(1))
+
+    def test_processor_drops_redeliveries_without_loading_the_workflow(self):
+        workflow_base = CountingWorkflowBase({})
+        processor = EventProcessor(workflow_base, WorkflowFactory(build_mail_loop()), EventDedupIndex())
+        processor.process(EmailReceivedEvent(1, 'wait_for_mail', event_id='<m1@example.com>'))
+        loads = workflow_base.loads
+        processor.process(EmailReceivedEvent(1, 'wait_for_mail', event_id='<m1@example.com>'))
+        processor.process_batch([EmailReceivedEvent(1, 'wait_for_mail', event_id='<m1@example.com>')])
+        assert_that(workflow_base.loads, equal_to(loads))
+        assert_that(processor.duplicates, equal_to(2))
+        assert_that(workflow_base.get_workflow(1).execution_counts['process_mail'], equal_to(1))
+
+    def test_batch_drops_duplicates_within_itself(self):
+        workflow_base = CountingWorkflowBase({})
+        processor = EventProcessor(workflow_base, WorkflowFactory(build_mail_loop()), EventDedupIndex())
+        processor.process_batch([EmailReceivedEvent(1, 'wait_for_mail', event_id='m1'),
+                                 EmailReceivedEvent(1, 'wait_for_mail', event_id='m1')])
+        assert_that(workflow_base.get_workflow(1).execution_counts['process_mail'], equal_to(1))
+
+    def test_batch_events_are_remembered_only_once_saved(self):
+        workflow_base = FailingWorkflowBase({})
+        processor = EventProcessor(workflow_base, WorkflowFactory(build_mail_loop()), EventDedupIndex())
+        event = EmailReceivedEvent(1, 'wait_for_mail', event_id='m1')
+        self.assertRaises(IOError, processor.process_batch, [event])
+        assert_that(processor.is_duplicate(event), equal_to(False))
+        workflow_base.failing = False
+        processor.process_batch([event])
+        assert_that(processor.is_duplicate(event), equal_to(True))
+
+    def test_redelivered_broadcast_completions_are_applied_once(self):
+        factory = WorkflowFactory(build_mail_loop())
+        store = SqliteWorkflowBase(":memory:", factory)
+        processor = EventProcessor(store, factory, EventDedupIndex())
+        processor.create_workflows([1, 2])
+        assert_that(processor.complete_waiting('wait_for_mail', None, event_id='b1'), equal_to([1, 2]))
+        assert_that(processor.complete_waiting('wait_for_mail', None, event_id='b1'), equal_to([]))
+        assert_that(processor.duplicates, equal_to(2))
+        assert_that(store.get_workflow(2).execution_counts['process_mail'], equal_to(1))
+        store.close()
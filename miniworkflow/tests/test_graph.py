@@ -0,0 +1,71 @@
+from StringIO import StringIO
+from unittest import TestCase
+from hamcrest import assert_that, contains_string, equal_to, is_not, starts_with, ends_with
+from miniworkflow import Node, Transition, WorkflowFactory, EventProcessor, EmailReceivedEvent, MiniWorkflow
+from miniworkflow.graph import DotWriter, RuntimeOverlay, dot_id
+from miniworkflow.instrumentation import Instrumentation
+from miniworkflow.tests.test_doubles.workflow_base_double import WorkflowBaseDouble
+from miniworkflow.tests.test_sqliteWorkflowBase import build_mail_loop
+
+
+def chain(length):
+    start = previous = Node("n0")
+    for i in range(1, length):
+        node = Node("n%d" % i)
+        previous.connect(Transition(node))
+        previous = node
+    return start
+
+
+def render(start, **options):
+    g = StringIO()
+    DotWriter(g, **options).write(start)
+    return g.getvalue()
+
+
+class TestDotWriter(TestCase):
+    def test_writes_every_node_and_transition(self):
+        dot = render(build_mail_loop())
+        assert_that(dot, starts_with("digraph Test {"))
+        assert_that(dot, contains_string('wait_for_mail [label="{<f0> wait_for_mail}"] \n'))
+        assert_that(dot, contains_string("process_mail -> wait_for_mail\n"))
+        assert_that(dot, ends_with("}"))
+
+    def test_walks_long_chains_without_recursing(self):
+        assert_that(render(chain(3000)), contains_string("n2998 -> n2999\n"))
+
+    def test_stops_at_the_depth_limit(self):
+        dot = render(chain(5), max_depth=2)
+        assert_that(dot, contains_string("n1 -> n2\n"))
+        assert_that(dot, is_not(contains_string("n3")))
+
+    def test_stops_at_the_node_limit(self):
+        dot = render(chain(5), max_nodes=3)
+        assert_that(dot, contains_string("n2 [label"))
+        assert_that(dot, is_not(contains_string("n3")))
+
+    def test_quotes_ids_that_need_it(self):
+        assert_that(dot_id('send "mail"'), equal_to('"send \\"mail\\""'))
+
+
+class TestRuntimeOverlay(TestCase):
+    def test_overlays_executions_and_waiting_nodes(self):
+        w = MiniWorkflow(build_mail_loop())
+        w.run()
+        w.complete_by_uuid('wait_for_mail', None)
+        w.run()
+        dot = render(w.start_node, overlay=RuntimeOverlay().add_workflow(w))
+        assert_that(dot, contains_string('process_mail [label="{<f0> process_mail|<f1> runs: 1}",style=filled'))
+        assert_that(dot, contains_string('<f1> runs: 1|<f2> waiting: 1}"'))
+        assert_that(dot, contains_string('color=orange'))
+        assert_that(dot, contains_string('wait_for_mail -> process_mail [label="1",penwidth=5.0]\n'))
+
+    def test_counts_edge_traversals_from_instrumentation(self):
+        instrumentation = Instrumentation()
+        processor = EventProcessor(WorkflowBaseDouble({}),
+                                   WorkflowFactory(build_mail_loop(), instrumentation=instrumentation))
+        for i in range(3):
+            processor.process(EmailReceivedEvent(i % 2, 'wait_for_mail'))
+        dot = render(build_mail_loop(), overlay=RuntimeOverlay().add_instrumentation(instrumentation))
+        assert_that(dot, contains_string('start -> wait_for_mail [label="2",penwidth=3.7]\n'))
+        assert_that(dot, contains_string('process_mail -> wait_for_mail [label="3",penwidth=5.0]\n'))
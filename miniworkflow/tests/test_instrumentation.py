@@ -0,0 +1,90 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, close_to, contains_string
+from miniworkflow import Node, Transition, TaskResult, WorkflowFactory, EventProcessor, EmailReceivedEvent, \
+    WaitForExternalEvent, MiniWorkflow
+from miniworkflow.instrumentation import Instrumentation, Histogram
+from miniworkflow.store import SqliteWorkflowBase
+from miniworkflow.tests.test_doubles.fake_clock import FakeClock
+from miniworkflow.tests.test_doubles.workflow_base_double import WorkflowBaseDouble
+
+
+class SlowDecomposition(object):
+    def __init__(self, clock, seconds):
+        self.clock = clock
+        self.seconds = seconds
+
+    def get_instance(self):
+        return self
+
+    def execute(self, node, workflow):
+        self.clock.advance(self.seconds)
+        return TaskResult.COMPLETED
+
+
+class TestHistogram(TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        assert_that(histogram.cumulative(), equal_to([(0.1, 2), (1.0, 3), ('+Inf', 4)]))
+        assert_that(histogram.sum, equal_to(2.65))
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.instrumentation = Instrumentation(clock=self.clock)
+        start = Node("start")
+        wait_for_mail = Node("wait_for_mail")
+        wait_for_mail.set_decomposition_factory(WaitForExternalEvent())
+        process_mail = Node("process_mail")
+        process_mail.set_decomposition_factory(SlowDecomposition(self.clock, 0.002))
+        start.connect(Transition(wait_for_mail))
+        wait_for_mail.connect(Transition(process_mail))
+        process_mail.connect(Transition(wait_for_mail))
+        self.factory = factory = WorkflowFactory(start, clock=self.clock, instrumentation=self.instrumentation)
+        self.processor = EventProcessor(WorkflowBaseDouble({}), factory, instrumentation=self.instrumentation)
+
+    def deliver_mail(self, after):
+        self.clock.advance(after)
+        self.processor.process(EmailReceivedEvent(1, 'wait_for_mail'))
+
+    def test_counts_activations_waits_and_completions(self):
+        self.deliver_mail(1)
+        self.deliver_mail(1)
+        counters = self.instrumentation.snapshot()['counters']
+        assert_that(counters['node_waits_total'], equal_to({'wait_for_mail': 3}))
+        assert_that(counters['node_completions_total'],
+                    equal_to({'start': 1, 'wait_for_mail': 2, 'process_mail': 2}))
+        assert_that(counters['node_activations_total']['process_mail'], equal_to(2))
+
+    def test_times_executions_waits_and_events(self):
+        # the first mail arrives as the instance is created, the second one 30s later
+        self.deliver_mail(1)
+        self.deliver_mail(30)
+        histograms = self.instrumentation.snapshot()['histograms']
+        assert_that(histograms['node_execute_seconds']['process_mail']['sum'], close_to(0.004, 1e-6))
+        assert_that(histograms['node_waiting_seconds']['wait_for_mail']['sum'], close_to(30, 1e-6))
+        assert_that(histograms['event_process_seconds']['EmailReceivedEvent']['count'], equal_to(2))
+
+    def test_times_waits_across_a_save_and_a_reload(self):
+        store = SqliteWorkflowBase(":memory:", self.factory)
+        self.processor = EventProcessor(store, self.factory, instrumentation=self.instrumentation)
+        self.deliver_mail(1)
+        assert_that(store.get_workflow(1).wait_started('wait_for_mail'), equal_to(self.clock()))
+        self.deliver_mail(45)
+        histogram = self.instrumentation.snapshot()['histograms']['node_waiting_seconds']['wait_for_mail']
+        assert_that(histogram['sum'], close_to(45, 1e-6))
+        store.close()
+
+    def test_exports_prometheus_text(self):
+        self.deliver_mail(1)
+        text = self.instrumentation.prometheus()
+        assert_that(text, contains_string('# TYPE miniworkflow_node_execute_seconds histogram\n'))
+        assert_that(text, contains_string('miniworkflow_node_execute_seconds_bucket{node="process_mail",le="+Inf"} 1\n'))
+        assert_that(text, contains_string('miniworkflow_node_waits_total{node="wait_for_mail"} 2\n'))
+        assert_that(text, contains_string('miniworkflow_event_process_seconds_count{event="EmailReceivedEvent"} 1\n'))
+
+    def test_instances_without_instrumentation_record_nothing(self):
+        MiniWorkflow(Node("start")).run()
+        assert_that(self.instrumentation.snapshot(), equal_to({'counters': {}, 'histograms': {}}))
@@ -8,4 +8,8 @@ class WorkflowBaseInterfaceTest:
 
     def test_responds_to_add_workflow(self):
         #noinspection PyUnresolvedReferences
-        assert_that(self.object, responds_to("add_workflow"))
\ No newline at end of file
+        assert_that(self.object, responds_to("add_workflow"))
+
+    def test_responds_to_save_workflow(self):
+        #noinspection PyUnresolvedReferences
+        assert_that(self.object, responds_to("save_workflow"))
@@ -0,0 +1,59 @@
+from Queue import Queue
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_item, is_not
+from miniworkflow import Node, Transition, MiniWorkflow, AndActivationPolicy, QuorumActivationPolicy, \
+    DiscriminatorActivationPolicy
+from miniworkflow.decomposition import QueueTaskDecomposition
+
+
+class TestJoins(TestCase):
+    def build_fan_in(self, width, policy):
+        self.queue = Queue()
+        start = Node("start")
+        join = Node("join", activation_policy=policy)
+        join.connect(Transition(Node("end")))
+        for i in range(width):
+            branch = Node("branch%d" % i)
+            branch.set_decomposition_factory(QueueTaskDecomposition(self.queue))
+            start.connect(Transition(branch))
+            branch.connect(Transition(join))
+        return start
+
+    def complete_branches(self, w, count):
+        for _ in range(count):
+            w.complete_by_uuid(self.queue.get(), None)
+            w.run()
+
+    def test_and_join_waits_for_every_branch(self):
+        w = MiniWorkflow(self.build_fan_in(50, AndActivationPolicy()))
+        w.run()
+        self.complete_branches(w, 49)
+        assert_that(w.executed_trace, is_not(has_item("join")))
+        self.complete_branches(w, 1)
+        assert_that(w.executed_trace[-2:], equal_to(["join", "end"]))
+
+    def test_quorum_join_fires_once_on_the_nth_branch(self):
+        w = MiniWorkflow(self.build_fan_in(5, QuorumActivationPolicy(3)))
+        w.run()
+        self.complete_branches(w, 2)
+        assert_that(w.executed_trace, is_not(has_item("join")))
+        self.complete_branches(w, 3)
+        assert_that(w.executed_trace.count("join"), equal_to(1))
+
+    def test_discriminator_fires_on_the_first_branch(self):
+        w = MiniWorkflow(self.build_fan_in(3, DiscriminatorActivationPolicy()))
+        w.run()
+        self.complete_branches(w, 1)
+        assert_that(w.executed_trace[-2:], equal_to(["join", "end"]))
+        self.complete_branches(w, 2)
+        assert_that(w.executed_trace.count("join"), equal_to(1))
+
+    def test_arrivals_survive_a_state_round_trip(self):
+        start = self.build_fan_in(2, AndActivationPolicy())
+        w = MiniWorkflow(start)
+        w.run()
+        self.complete_branches(w, 1)
+        continuation = MiniWorkflow(start)
+        continuation.set_state(w.get_state())
+        self.complete_branches(continuation, 1)
+        assert_that(continuation.executed_trace, has_item("join"))
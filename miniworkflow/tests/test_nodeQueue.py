@@ -0,0 +1,23 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_length, is_not, has_item
+from miniworkflow import NodeQueue
+
+
+class TestNodeQueue(TestCase):
+    def test_pops_in_insertion_order(self):
+        q = NodeQueue(['a', 'b', 'a'])
+        assert_that([q.popleft() for _ in range(3)], equal_to(['a', 'b', 'a']))
+        assert_that(q, has_length(0))
+
+    def test_remove_drops_the_oldest_occurrence(self):
+        q = NodeQueue(['a', 'b', 'a', 'c'])
+        q.remove('a')
+        assert_that(list(q), equal_to(['b', 'a', 'c']))
+        assert_that(q.count('a'), equal_to(1))
+
+    def test_membership_follows_removals(self):
+        q = NodeQueue(['a'])
+        assert_that(q, has_item('a'))
+        q.remove('a')
+        assert_that(q, is_not(has_item('a')))
+        self.assertRaises(ValueError, q.remove, 'a')
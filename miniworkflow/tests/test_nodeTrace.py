@@ -0,0 +1,65 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_length
+from miniworkflow import NodeTrace, WorkflowSpec, WorkflowFactory, EmailReceivedEvent, EventProcessor
+from miniworkflow.encoding import encode_workflow, decode_state
+from miniworkflow.tests.test_doubles.workflow_base_double import WorkflowBaseDouble
+from miniworkflow.tests.test_sqliteWorkflowBase import build_mail_loop
+
+
+class TestNodeTrace(TestCase):
+    def setUp(self):
+        self.spec = WorkflowSpec(build_mail_loop())
+
+    def test_keeps_everything_by_default(self):
+        trace = NodeTrace(self.spec, ['start', 'wait_for_mail', 'process_mail'])
+        assert_that(trace, equal_to(['start', 'wait_for_mail', 'process_mail']))
+        assert_that(trace[-1], equal_to('process_mail'))
+
+    def test_ring_buffer_keeps_the_last_entries(self):
+        trace = NodeTrace(self.spec, ['start', 'wait_for_mail', 'process_mail', 'wait_for_mail'], limit=2)
+        assert_that(trace, equal_to(['process_mail', 'wait_for_mail']))
+        assert_that(trace.total, equal_to(4))
+
+    def test_indexes_the_ring_buffer_in_trace_order(self):
+        trace = NodeTrace(self.spec, ['start', 'wait_for_mail', 'process_mail', 'wait_for_mail', 'start'], limit=3)
+        assert_that(trace[0], equal_to('process_mail'))
+        assert_that(trace[-1], equal_to('start'))
+        assert_that(trace[-2:], equal_to(['wait_for_mail', 'start']))
+        assert_that(trace[::-1], equal_to(['start', 'wait_for_mail', 'process_mail']))
+        self.assertRaises(IndexError, lambda: trace[3])
+        self.assertRaises(IndexError, lambda: NodeTrace(self.spec, limit=0)[-1])
+
+    def test_counters_only_keeps_no_entries(self):
+        trace = NodeTrace(self.spec, ['start', 'wait_for_mail'], limit=0)
+        assert_that(trace, has_length(0))
+        assert_that(trace.total, equal_to(2))
+
+    def test_looping_workflow_state_stays_bounded(self):
+        factory = WorkflowFactory(build_mail_loop(), trace_limit=4)
+        workflow_base = WorkflowBaseDouble({})
+        processor = EventProcessor(workflow_base, factory)
+        for _ in range(100):
+            processor.process(EmailReceivedEvent(1, 'wait_for_mail'))
+        state = workflow_base.get_workflow(1).get_state()
+        assert_that(state['executed_trace'], has_length(4))
+        assert_that(state['execution_counts']['process_mail'], equal_to(100))
+        resumed = factory.create_instance()
+        resumed.set_state(state)
+        assert_that(resumed.execution_counts, equal_to(workflow_base.get_workflow(1).execution_counts))
+        assert_that(resumed.executed_trace.total, equal_to(workflow_base.get_workflow(1).executed_trace.total))
+
+    def test_restored_traces_keep_their_total(self):
+        factory = WorkflowFactory(build_mail_loop(), trace_limit=4)
+        w = factory.create_instance()
+        w.run()
+        for _ in range(10):
+            w.complete_by_uuid('wait_for_mail', {})
+            w.run()
+        resumed = factory.create_instance()
+        resumed.set_state(w.get_state())
+        assert_that(resumed.executed_trace, has_length(4))
+        assert_that(resumed.executed_trace.total, equal_to(w.executed_trace.total))
+        decoded = factory.create_instance()
+        decoded.set_state(decode_state(encode_workflow(w), factory.spec))
+        assert_that([decoded.activation_trace.total, decoded.waiting_trace.total, decoded.executed_trace.total],
+                    equal_to([w.activation_trace.total, w.waiting_trace.total, w.executed_trace.total]))
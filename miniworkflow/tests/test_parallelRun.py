@@ -0,0 +1,122 @@
+import time
+from multiprocessing.pool import ThreadPool
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, less_than, contains_inanyorder
+from miniworkflow import Node, Transition, MiniWorkflow, AndActivationPolicy, TaskResult, WorkflowEvent
+
+
+class SlowExternalProcess(object):
+    def __init__(self, delay):
+        self.delay = delay
+
+    def get_instance(self):
+        return self
+
+    def execute(self, node, workflow):
+        time.sleep(self.delay)
+        workflow.update_workflow_variables({node.uuid(): True})
+        return TaskResult.COMPLETED
+
+
+class RecordingProcess(object):
+    def __init__(self, log):
+        self.log = log
+
+    def get_instance(self):
+        return self
+
+    def execute(self, node, workflow):
+        self.log.append(("decomposition", node.uuid(), node.uuid() in workflow.active_nodes))
+        return TaskResult.COMPLETED
+
+
+class ExecuteLog(object):
+    def __init__(self, log):
+        self.log = log
+
+    def notify(self, event, node):
+        self.log.append((event, node.uuid()))
+
+
+class TestParallelRun(TestCase):
+    def setUp(self):
+        self.pool = ThreadPool(8)
+
+    def tearDown(self):
+        self.pool.close()
+        self.pool.join()
+
+    def build_fan_out(self, width, delay):
+        start = Node("start")
+        join = Node("join", activation_policy=AndActivationPolicy())
+        join.connect(Transition(Node("end")))
+        for i in range(width):
+            branch = Node("branch%d" % i)
+            branch.set_decomposition_factory(SlowExternalProcess(delay))
+            start.connect(Transition(branch))
+            branch.connect(Transition(join))
+        return start
+
+    def test_runs_independent_branches_concurrently(self):
+        w = MiniWorkflow(self.build_fan_out(8, 0.05))
+        started = time.time()
+        w.run_parallel(self.pool)
+        assert_that(time.time() - started, less_than(8 * 0.05))
+        assert_that(w.executed_trace[-2:], equal_to(["join", "end"]))
+        assert_that(len(w.workflow_variables), equal_to(8))
+
+    def test_deterministic_mode_reproduces_the_sequential_trace(self):
+        start = self.build_fan_out(6, 0)
+        sequential = MiniWorkflow(start)
+        sequential.run()
+        parallel = MiniWorkflow(start)
+        parallel.run_parallel(self.pool)
+        assert_that(parallel.executed_trace, equal_to(sequential.executed_trace))
+        assert_that(parallel.activation_trace, equal_to(sequential.activation_trace))
+
+    def test_nodes_are_announced_before_their_decomposition_runs(self):
+        log = []
+        start = Node("start")
+        task = Node("task")
+        task.set_decomposition_factory(RecordingProcess(log))
+        start.connect(Transition(task))
+        w = MiniWorkflow(start)
+        w.observer.subscribe(WorkflowEvent.NODE_EXECUTE, ExecuteLog(log))
+        w.run_parallel(self.pool)
+        assert_that(log, equal_to([(WorkflowEvent.NODE_EXECUTE, "start"), (WorkflowEvent.NODE_EXECUTE, "task"),
+                                   ("decomposition", "task", True)]))
+
+    def test_loops_through_a_join_reproduce_the_sequential_trace(self):
+        start = Node("start")
+        x = Node("x")
+        y = Node("y")
+        join = Node("join", activation_policy=AndActivationPolicy())
+        again = Node("again")
+        start.connect(Transition(x))
+        start.connect(Transition(y))
+        x.connect(Transition(join))
+        y.connect(Transition(join))
+        join.connect(Transition(again))
+        again.connect(Transition(x, lambda w, n: w.execution_counts['again'] < 2))
+        again.connect(Transition(y, lambda w, n: w.execution_counts['again'] < 2))
+        again.connect(Transition(Node("end"), lambda w, n: w.execution_counts['again'] >= 2))
+        sequential = MiniWorkflow(start)
+        sequential.run()
+        parallel = MiniWorkflow(start)
+        parallel.run_parallel(self.pool)
+        assert_that(list(sequential.executed_trace),
+                    equal_to(["start", "x", "y", "join", "again", "x", "y", "join", "again", "end"]))
+        assert_that(parallel.executed_trace, equal_to(sequential.executed_trace))
+
+    def test_completion_order_mode_executes_every_node(self):
+        start = self.build_fan_out(6, 0.001)
+        sequential = MiniWorkflow(start)
+        sequential.run()
+        parallel = MiniWorkflow(start)
+        parallel.run_parallel(self.pool, deterministic=False)
+        assert_that(parallel.executed_trace, contains_inanyorder(*sequential.executed_trace))
+
+    def test_honours_max_steps(self):
+        w = MiniWorkflow(self.build_fan_out(6, 0))
+        w.run_parallel(self.pool, max_steps=3)
+        assert_that(len(w.executed_trace), equal_to(3))
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_item
+from miniworkflow import WorkflowFactory, EventProcessor, EmailReceivedEvent
+from miniworkflow.sharding import ShardedEventProcessor, ShardFailed, shard_for
+from miniworkflow.store import SqliteWorkflowBase
+from miniworkflow.tests.test_sqliteWorkflowBase import build_mail_loop
+
+
+class TestShardedEventProcessor(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.factory = WorkflowFactory(build_mail_loop())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def shard_path(self, shard):
+        return os.path.join(self.directory, "shard-%d.db" % shard)
+
+    def build_processor(self, shard, _):
+        return EventProcessor(SqliteWorkflowBase(self.shard_path(shard), self.factory), self.factory)
+
+    def test_each_shard_owns_its_slice_of_the_workflows(self):
+        sharded = ShardedEventProcessor(self.build_processor, 3)
+        sharded.start()
+        for workflow_id in range(30):
+            sharded.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+            sharded.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+        sharded.stop()
+        for workflow_id in range(30):
+            store = SqliteWorkflowBase(self.shard_path(shard_for(workflow_id, 3)), self.factory)
+            w = store.get_workflow(workflow_id)
+            store.close()
+            assert_that(w.execution_counts['process_mail'], equal_to(2))
+
+    def test_reports_per_shard_queue_depth(self):
+        sharded = ShardedEventProcessor(self.build_processor, 2)
+        sharded.start()
+        for workflow_id in range(10):
+            sharded.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+        sharded.drain()
+        assert_that(sharded.queue_depths(), equal_to([0, 0]))
+        assert_that(sum(s['processed'] for s in sharded.stats()), equal_to(10))
+        sharded.stop()
+
+    def test_resize_keeps_processing_over_a_shared_store(self):
+        shared = lambda shard, shards: self.build_processor(0, shards)
+        sharded = ShardedEventProcessor(shared, 2, shared_store=True)
+        sharded.start()
+        sharded.process(EmailReceivedEvent(7, "wait_for_mail"))
+        sharded.resize(3)
+        sharded.process(EmailReceivedEvent(7, "wait_for_mail"))
+        sharded.stop()
+        store = SqliteWorkflowBase(self.shard_path(0), self.factory)
+        assert_that(store.get_workflow(7).executed_trace, has_item('process_mail'))
+        assert_that(store.get_workflow(7).execution_counts['process_mail'], equal_to(2))
+        store.close()
+
+    def test_refuses_to_resize_per_shard_stores(self):
+        sharded = ShardedEventProcessor(self.build_processor, 2)
+        self.assertRaises(ValueError, sharded.resize, 3)
+
+    def test_reports_shards_whose_worker_died(self):
+        def build_processor(shard, shards):
+            if shard == 1:
+                raise IOError("store unavailable")
+            return self.build_processor(shard, shards)
+
+        sharded = ShardedEventProcessor(build_processor, 2)
+        sharded.start()
+        for workflow_id in range(10):
+            sharded.process(EmailReceivedEvent(workflow_id, "wait_for_mail"))
+        with self.assertRaises(ShardFailed) as raised:
+            sharded.stop()
+        assert_that(raised.exception.shards, equal_to([1]))
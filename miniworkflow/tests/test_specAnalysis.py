@@ -0,0 +1,156 @@
+from multiprocessing.pool import ThreadPool
+from unittest import TestCase, skipIf
+from hamcrest import assert_that, equal_to
+from miniworkflow import Node, Transition, MiniWorkflow, AndActivationPolicy, WorkflowSpec, WaitForExternalEvent
+
+try:
+    from miniworkflow.aio import asyncio
+except ImportError:
+    asyncio = None
+
+
+def build_reopen_flow():
+    start = Node("start")
+    wait_for_imp_mail = Node("wait_for_imp_mail")
+    wait_for_target_mail = Node("wait_for_target_mail")
+    get_target_os = Node("get_target_os")
+    reopen_os_ticket = Node("reopen_os_ticket")
+    gen_test_cases = Node("gen_test_cases", activation_policy=AndActivationPolicy())
+    end = Node("end")
+    start.connect(Transition(wait_for_imp_mail))
+    start.connect(Transition(wait_for_target_mail))
+    wait_for_imp_mail.connect(Transition(gen_test_cases))
+    wait_for_target_mail.connect(Transition(get_target_os))
+    wait_for_target_mail.set_decomposition_factory(WaitForExternalEvent())
+    get_target_os.connect(Transition(gen_test_cases))
+    get_target_os.connect(Transition(reopen_os_ticket, condition=lambda *_: False))
+    reopen_os_ticket.connect(Transition(wait_for_target_mail))
+    gen_test_cases.connect(Transition(end))
+    return start
+
+
+def build_spin():
+    start = Node("start")
+    spin = Node("spin")
+    start.connect(Transition(spin))
+    spin.connect(Transition(spin))
+    return start
+
+
+def uuids(spec, node_ids):
+    return set(spec.node_by_id(i).uuid() for i in node_ids)
+
+
+class TestSpecAnalysis(TestCase):
+    def test_finds_loops_and_the_edges_closing_them(self):
+        spec = WorkflowSpec(build_reopen_flow())
+        analysis = spec.analysis
+        assert_that([uuids(spec, loop) for loop in analysis.loops],
+                    equal_to([set(["wait_for_target_mail", "get_target_os", "reopen_os_ticket"])]))
+        assert_that(analysis.back_edges, equal_to((("reopen_os_ticket", "wait_for_target_mail"),)))
+        assert_that(uuids(spec, analysis.terminals), equal_to(set(["end"])))
+        assert_that(analysis.dead_ends, equal_to(()))
+        assert_that(any(analysis.spins), equal_to(False))
+        assert_that(spec.analysis, equal_to(analysis))
+
+    def test_reachability(self):
+        analysis = WorkflowSpec(build_reopen_flow()).analysis
+        assert_that(analysis.can_reach("reopen_os_ticket", "end"), equal_to(True))
+        assert_that(analysis.can_reach("get_target_os", "get_target_os"), equal_to(True))
+        assert_that(analysis.can_reach("wait_for_imp_mail", "get_target_os"), equal_to(False))
+        assert_that(analysis.can_reach("end", "start"), equal_to(False))
+
+    def test_join_fan_in(self):
+        spec = WorkflowSpec(build_reopen_flow())
+        join = spec.node_id("gen_test_cases")
+        assert_that(spec.analysis.fan_in[join], equal_to(2))
+        assert_that(spec.analysis.required_arrivals[join], equal_to(2))
+        assert_that(spec.analysis.joins, equal_to((("gen_test_cases", 2),)))
+        assert_that(spec.analysis.deadlocking_joins, equal_to(()))
+
+    def test_unreachable_nodes_dead_ends_and_deadlocking_joins(self):
+        start = Node("start")
+        spin = Node("spin")
+        orphan = Node("orphan")
+        join = Node("join", activation_policy=AndActivationPolicy())
+        start.connect(Transition(spin))
+        start.connect(Transition(join))
+        spin.connect(Transition(spin))
+        orphan.connect(Transition(join))
+        join.connect(Transition(Node("end")))
+        spec = WorkflowSpec(start)
+        analysis = spec.analysis
+        assert_that(analysis.unreachable, equal_to(("orphan",)))
+        assert_that(uuids(spec, analysis.dead_ends), equal_to(set(["spin"])))
+        assert_that(uuids(spec, analysis.deadlocking_joins), equal_to(set(["join"])))
+        assert_that([spec.node_by_id(i).uuid() for i, spins in enumerate(analysis.spins) if spins],
+                    equal_to(["spin"]))
+
+    def test_a_join_left_without_arrivals_is_deadlocked(self):
+        start = Node("start")
+        orphan = Node("orphan")
+        join = Node("join", activation_policy=AndActivationPolicy())
+        start.connect(Transition(join))
+        orphan.connect(Transition(join))
+        w = MiniWorkflow(start)
+        w.run()
+        assert_that(w.is_finished(), equal_to(True))
+        assert_that(w.is_deadlocked(), equal_to(True))
+        assert_that(w.is_stuck(), equal_to(False))
+
+    def test_run_stops_once_every_active_node_spins(self):
+        w = MiniWorkflow(build_spin())
+        w.run()
+        assert_that(w.execution_counts["spin"], equal_to(1))
+        assert_that(w.is_stuck(), equal_to(True))
+        assert_that(w.is_finished(), equal_to(False))
+
+    def test_run_parallel_stops_once_every_active_node_spins(self):
+        pool = ThreadPool(2)
+        try:
+            w = MiniWorkflow(build_spin())
+            w.run_parallel(pool)
+        finally:
+            pool.close()
+            pool.join()
+        assert_that(w.execution_counts["spin"], equal_to(1))
+        assert_that(w.is_stuck(), equal_to(True))
+
+    @skipIf(asyncio is None, "needs asyncio or trollius")
+    def test_run_async_stops_once_every_active_node_spins(self):
+        loop = asyncio.new_event_loop()
+        try:
+            w = loop.run_until_complete(MiniWorkflow(build_spin()).run_async(loop=loop))
+        finally:
+            loop.close()
+        assert_that(w.execution_counts["spin"], equal_to(1))
+        assert_that(w.is_stuck(), equal_to(True))
+
+    def test_loops_with_conditions_or_joins_do_not_spin(self):
+        start = Node("start")
+        loop = Node("loop")
+        start.connect(Transition(loop))
+        loop.connect(Transition(loop, lambda w, n: w.execution_counts['loop'] < 10))
+        w = MiniWorkflow(start)
+        assert_that(any(w.spec.analysis.spins), equal_to(False))
+        w.run()
+        assert_that(w.execution_counts["loop"], equal_to(10))
+        assert_that(w.is_finished(), equal_to(True))
+        start = Node("start")
+        join = Node("join", activation_policy=AndActivationPolicy())
+        start.connect(Transition(join))
+        join.connect(Transition(join))
+        assert_that(any(WorkflowSpec(start).analysis.spins), equal_to(False))
+
+    def test_waiting_instances_are_not_stuck(self):
+        w = MiniWorkflow(build_reopen_flow())
+        w.run()
+        assert_that(list(w.waiting_list), equal_to(["wait_for_target_mail"]))
+        assert_that(w.is_stuck(), equal_to(False))
+        assert_that(w.is_finished(), equal_to(False))
+        w.complete_by_uuid("wait_for_target_mail", {})
+        w.run()
+        assert_that(w.is_finished(), equal_to(True))
+        assert_that(w.is_stuck(), equal_to(False))
+        assert_that(w.is_deadlocked(), equal_to(False))
+        assert_that(w.execution_counts["end"], equal_to(1))
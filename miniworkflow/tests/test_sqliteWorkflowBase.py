@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_item, is_not
+from miniworkflow import Node, Transition, WorkflowFactory, EventProcessor, EmailReceivedEvent, \
+    WaitForExternalEvent, WorkflowNotFound
+from miniworkflow.store import SqliteWorkflowBase
+from miniworkflow.tests.test_interfaces.test_workflowBaseInterface import WorkflowBaseInterfaceTest
+
+
+def build_mail_loop():
+    start = Node("start")
+    wait_for_mail = Node("wait_for_mail")
+    wait_for_mail.set_decomposition_factory(WaitForExternalEvent())
+    process_mail = Node("process_mail")
+    start.connect(Transition(wait_for_mail))
+    wait_for_mail.connect(Transition(process_mail))
+    process_mail.connect(Transition(wait_for_mail))
+    return start
+
+
+class TestSqliteWorkflowBase(TestCase, WorkflowBaseInterfaceTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "workflows.db")
+        self.factory = WorkflowFactory(build_mail_loop())
+        self.object = SqliteWorkflowBase(self.path, self.factory, snapshot_interval=10)
+
+    def tearDown(self):
+        self.object.close()
+        shutil.rmtree(self.directory)
+
+    def test_unknown_workflow_is_not_found(self):
+        self.assertRaises(WorkflowNotFound, self.object.get_workflow, 1)
+
+    def test_resumes_from_snapshot_and_journal(self):
+        processor = EventProcessor(self.object, self.factory)
+        processor.process(EmailReceivedEvent(1, "wait_for_mail"))
+        assert_that(self.object.journal_length(1), is_not(equal_to(0)))
+
+        reopened = SqliteWorkflowBase(self.path, self.factory)
+        w = reopened.get_workflow(1)
+        reopened.close()
+        assert_that(w.executed_trace, equal_to(['start', 'wait_for_mail', 'process_mail']))
+        assert_that(list(w.waiting_list), equal_to(['wait_for_mail']))
+
+    def test_snapshots_bound_the_journal(self):
+        processor = EventProcessor(self.object, self.factory)
+        for _ in range(20):
+            processor.process(EmailReceivedEvent(1, "wait_for_mail"))
+            assert_that(self.object.journal_length(1) < 10)
+        assert_that(self.object.get_workflow(1).execution_counts['process_mail'], equal_to(20))
+
+    def test_compact_folds_the_journal_into_the_snapshot(self):
+        processor = EventProcessor(self.object, self.factory)
+        processor.process(EmailReceivedEvent(1, "wait_for_mail"))
+        before = self.object.get_workflow(1).get_state()
+        self.object.compact(1)
+        assert_that(self.object.journal_length(1), equal_to(0))
+        assert_that(self.object.get_workflow(1).get_state(), equal_to(before))
+
+    def test_state_is_detached_from_the_live_instance(self):
+        w = self.factory.create_instance()
+        w.run()
+        state = w.get_state()
+        w.complete_by_uuid("wait_for_mail", None)
+        w.run()
+        assert_that(state['executed_trace'], is_not(has_item('process_mail')))
+
+
+def build_two_waits():
+    start = Node("start")
+    wait_a = Node("wait_a")
+    wait_a.set_decomposition_factory(WaitForExternalEvent())
+    wait_b = Node("wait_b")
+    wait_b.set_decomposition_factory(WaitForExternalEvent())
+    start.connect(Transition(wait_a))
+    wait_a.connect(Transition(wait_b))
+    wait_b.connect(Transition(Node("end")))
+    return start
+
+
+class TestWaitingIndex(TestCase):
+    def setUp(self):
+        self.factory = WorkflowFactory(build_two_waits())
+        self.store = SqliteWorkflowBase(":memory:", self.factory, snapshot_interval=5)
+        self.processor = EventProcessor(self.store, self.factory)
+        for workflow_id in range(6):
+            self.processor.process(EmailReceivedEvent(workflow_id, "wait_a"))
+        for workflow_id in range(2):
+            self.processor.process(EmailReceivedEvent(workflow_id, "wait_b"))
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_indexes_workflows_by_waiting_node(self):
+        assert_that(sorted(self.store.waiting_on("wait_b")), equal_to([2, 3, 4, 5]))
+        assert_that(self.store.count_waiting("wait_a"), equal_to(0))
+
+    def test_broadcasts_a_completion_to_every_waiting_workflow(self):
+        completed = self.store.complete_waiting("wait_b", None)
+        assert_that(sorted(completed), equal_to([2, 3, 4, 5]))
+        assert_that(self.store.count_waiting("wait_b"), equal_to(0))
+        assert_that(self.store.get_workflow(3).executed_trace[-1], equal_to("end"))
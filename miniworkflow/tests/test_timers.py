@@ -0,0 +1,127 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, has_item, is_not
+from miniworkflow import Node, Transition, WorkflowFactory, EventProcessor, EmailReceivedEvent, \
+    WaitForExternalEvent
+from miniworkflow.store import SqliteWorkflowBase
+from miniworkflow.timers import TimerQueue
+from miniworkflow.tests.test_doubles.fake_clock import FakeClock
+from miniworkflow.tests.test_eventBatching import CountingWorkflowBase
+
+
+def build_reminder_flow():
+    start = Node("start")
+    wait_for_reply = Node("wait_for_reply", timeout=60)
+    wait_for_reply.set_decomposition_factory(WaitForExternalEvent())
+    follow_up = Node("follow_up")
+    start.connect(Transition(wait_for_reply))
+    wait_for_reply.connect(Transition(follow_up))
+    follow_up.connect(Transition(Node("close"), delay=30))
+    return start
+
+
+class FlakyWorkflowBase(CountingWorkflowBase):
+    def __init__(self, workflow_dict):
+        super(FlakyWorkflowBase, self).__init__(workflow_dict)
+        self.broken = set()
+
+    def get_workflow(self, workflow_id):
+        if workflow_id in self.broken:
+            raise IOError("store unavailable")
+        return super(FlakyWorkflowBase, self).get_workflow(workflow_id)
+
+
+class TestTimers(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.factory = WorkflowFactory(build_reminder_flow(), clock=self.clock)
+        self.workflow_base = FlakyWorkflowBase({})
+        self.timers = TimerQueue(self.clock)
+        self.processor = EventProcessor(self.workflow_base, self.factory, timers=self.timers)
+
+    def start_workflows(self, workflow_ids):
+        for workflow_id in workflow_ids:
+            w = self.factory.create_instance()
+            w.run()
+            self.workflow_base.add_workflow(workflow_id, w)
+            self.processor.save(workflow_id, w)
+
+    def test_times_out_waiting_nodes(self):
+        self.start_workflows([1])
+        self.clock.advance(59)
+        assert_that(self.processor.fire_timers(), equal_to([]))
+        self.clock.advance(1)
+        assert_that(self.processor.fire_timers(), equal_to([1]))
+        assert_that(self.workflow_base.get_workflow(1).executed_trace, has_item('follow_up'))
+
+    def test_completion_cancels_the_timeout(self):
+        self.start_workflows([1])
+        self.processor.process(EmailReceivedEvent(1, 'wait_for_reply'))
+        self.clock.advance(60)
+        self.processor.fire_timers()
+        assert_that(self.workflow_base.get_workflow(1).execution_counts['wait_for_reply'], equal_to(1))
+
+    def test_delayed_transitions_activate_after_their_delay(self):
+        self.start_workflows([1])
+        self.processor.process(EmailReceivedEvent(1, 'wait_for_reply'))
+        w = self.workflow_base.get_workflow(1)
+        assert_that(w.executed_trace, is_not(has_item('close')))
+        self.clock.advance(30)
+        self.processor.fire_timers()
+        assert_that(w.executed_trace[-1], equal_to('close'))
+
+    def test_only_loads_workflows_with_expired_deadlines(self):
+        self.start_workflows(range(10))
+        self.clock.advance(30)
+        self.start_workflows(range(10, 100))
+        self.clock.advance(30)
+        loads = self.workflow_base.loads
+        assert_that(self.processor.fire_timers(), equal_to(range(10)))
+        assert_that(self.workflow_base.loads - loads, equal_to(10))
+
+    def test_times_out_instances_created_in_bulk(self):
+        self.processor.create_workflows([1, 2, 3])
+        self.clock.advance(60)
+        assert_that(self.processor.fire_timers(), equal_to([1, 2, 3]))
+        assert_that(self.workflow_base.get_workflow(2).executed_trace, has_item('follow_up'))
+
+    def test_a_failing_workflow_is_retried_without_holding_back_the_others(self):
+        self.start_workflows([1, 2, 3])
+        self.workflow_base.broken.add(2)
+        self.clock.advance(60)
+        self.assertRaises(IOError, self.processor.fire_timers)
+        for workflow_id in (1, 3):
+            assert_that(self.workflow_base.get_workflow(workflow_id).executed_trace, has_item('follow_up'))
+        self.workflow_base.broken.clear()
+        assert_that(self.processor.fire_timers(), equal_to([2]))
+        assert_that(self.workflow_base.get_workflow(2).executed_trace, has_item('follow_up'))
+
+    def test_drops_timers_of_workflows_no_longer_stored(self):
+        self.start_workflows([1, 2])
+        del self.workflow_base.workflow_dict[1]
+        self.clock.advance(60)
+        assert_that(self.processor.fire_timers(), equal_to([2]))
+        assert_that(len(self.timers), equal_to(1))
+
+    def test_tracks_timers_scheduled_by_a_bulk_completion(self):
+        store = SqliteWorkflowBase(":memory:", self.factory)
+        processor = EventProcessor(store, self.factory, timers=self.timers)
+        processor.create_workflows([1, 2])
+        assert_that(processor.complete_waiting('wait_for_reply', None), equal_to([1, 2]))
+        self.clock.advance(30)
+        assert_that(processor.fire_timers(), equal_to([1, 2]))
+        assert_that(store.get_workflow(2).executed_trace[-1], equal_to('close'))
+        store.close()
+
+    def test_sqlite_store_keeps_timers_for_rebuilding_the_queue(self):
+        store = SqliteWorkflowBase(":memory:", self.factory)
+        processor = EventProcessor(store, self.factory, timers=TimerQueue(self.clock))
+        processor.process(EmailReceivedEvent(1, 'wait_for_reply'))
+        waiting = self.factory.create_instance()
+        waiting.run()
+        store.add_workflow(2, waiting)
+        rebuilt = TimerQueue(self.clock)
+        for workflow_id, timers in store.tracked_timers():
+            rebuilt.track(workflow_id, timers)
+        self.clock.advance(60)
+        assert_that(rebuilt.pop_due(), equal_to([1, 2]))
+        store.close()
@@ -3,13 +3,21 @@ from StringIO import StringIO
 from unittest import TestCase
 from hamcrest import assert_that, equal_to, has_length, has_item, is_not, starts_with
 from miniworkflow import Transition, MiniWorkflow, Node, AndActivationPolicy, WorkflowFactory, EventProcessor, EmailReceivedEvent, WaitForExternalEvent, WorkflowEvent
-from miniworkflow.bus import WorkflowEventPublisher
+from miniworkflow.bus import BatchingWorkflowEventPublisher, EventBatcher
 from miniworkflow.decomposition import QueueTaskDecomposition
 from miniworkflow.tests.test_doubles.external_process_double import ExternalProcessDouble
+from miniworkflow.tests.test_doubles.fake_broker import FakeBroker
 from miniworkflow.tests.test_doubles.workflow_base_double import WorkflowBaseDouble
 
 
 class TestWorkflowEngine(TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.batcher = EventBatcher(connection_factory=self.broker)
+
+    def tearDown(self):
+        self.batcher.shutdown()
+
     def test_workflow_execution_exits_when_no_ready_tasks(self):
         node1 = Node("first")
         node1.set_decomposition_factory(ExternalProcessDouble())
@@ -92,10 +100,10 @@ class TestWorkflowEngine(TestCase):
         return START
 
     def subscribe(self, w):
-        w.observer.subscribe(WorkflowEvent.NODE_COMPLETED, WorkflowEventPublisher("workflow_ticketing"))
-        w.observer.subscribe(WorkflowEvent.NODE_EXECUTE, WorkflowEventPublisher("workflow_ticketing"))
-        w.observer.subscribe(WorkflowEvent.NODE_SET_ACTIVE, WorkflowEventPublisher("workflow_ticketing"))
-        w.observer.subscribe(WorkflowEvent.NODE_WAIT, WorkflowEventPublisher("workflow_ticketing"))
+        w.observer.subscribe(WorkflowEvent.NODE_COMPLETED, BatchingWorkflowEventPublisher("workflow_ticketing", self.batcher))
+        w.observer.subscribe(WorkflowEvent.NODE_EXECUTE, BatchingWorkflowEventPublisher("workflow_ticketing", self.batcher))
+        w.observer.subscribe(WorkflowEvent.NODE_SET_ACTIVE, BatchingWorkflowEventPublisher("workflow_ticketing", self.batcher))
+        w.observer.subscribe(WorkflowEvent.NODE_WAIT, BatchingWorkflowEventPublisher("workflow_ticketing", self.batcher))
 
     def test_conditional_loop(self):
         START = self.build_workflow_def()
@@ -0,0 +1,86 @@
+from unittest import TestCase
+import simplejson
+from hamcrest import assert_that, equal_to, has_length
+from miniworkflow import Node, MiniWorkflow, Transition, WorkflowEvent
+from miniworkflow.bus import WorkflowEventPublisher, BatchingWorkflowEventPublisher, EventBatcher
+from miniworkflow.tests.test_doubles.fake_broker import FakeBroker
+
+
+class TestWorkflowEventPublisher(TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+
+    def published_events(self):
+        events = []
+        for _, _, body in self.broker.published:
+            decoded = simplejson.loads(body)
+            events.extend(decoded if isinstance(decoded, list) else [decoded])
+        return events
+
+    def test_publishes_one_message_per_event(self):
+        publisher = WorkflowEventPublisher("workflow_ticketing", connection_factory=self.broker)
+        publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("n"))
+        publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("m"))
+        assert_that(self.broker.published, has_length(2))
+
+    def test_batching_publishers_share_one_connection(self):
+        batcher = EventBatcher(connection_factory=self.broker, batch_size=1000, flush_interval=10, packed=True)
+        start = Node("start")
+        start.connect(Transition(Node("end")))
+        w = MiniWorkflow(start)
+        for event in (WorkflowEvent.NODE_EXECUTE, WorkflowEvent.NODE_SET_ACTIVE):
+            w.observer.subscribe(event, BatchingWorkflowEventPublisher("workflow_ticketing", batcher))
+        w.run()
+        batcher.shutdown()
+        assert_that(self.broker.connections, equal_to(1))
+        assert_that(self.broker.published, has_length(1))
+        assert_that([e['data'] for e in self.published_events()], equal_to(['start', 'end', 'end']))
+
+    def test_flushes_when_a_batch_is_full(self):
+        batcher = EventBatcher(connection_factory=self.broker, batch_size=2, flush_interval=10, packed=True)
+        publisher = BatchingWorkflowEventPublisher("workflow_ticketing", batcher)
+        for i in range(4):
+            publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("n%d" % i))
+        publisher.flush()
+        assert_that(self.broker.published, has_length(2))
+        batcher.shutdown()
+
+    def test_keeps_one_message_per_event_on_the_publisher_exchange_and_routing_key(self):
+        batcher = EventBatcher(connection_factory=self.broker, batch_size=1000, flush_interval=10)
+        publisher = BatchingWorkflowEventPublisher("tickets", batcher, routing_key="workflow.events")
+        publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("n"))
+        publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("m"))
+        batcher.shutdown()
+        assert_that([(exchange, routing_key) for exchange, routing_key, _ in self.broker.published],
+                    equal_to([("tickets", "workflow.events")] * 2))
+        assert_that([simplejson.loads(body) for _, _, body in self.broker.published],
+                    equal_to([{'event': WorkflowEvent.NODE_EXECUTE, 'data': 'n'},
+                              {'event': WorkflowEvent.NODE_EXECUTE, 'data': 'm'}]))
+
+    def test_packs_a_batch_per_exchange_and_routing_key(self):
+        batcher = EventBatcher(connection_factory=self.broker, batch_size=1000, flush_interval=10, packed=True)
+        BatchingWorkflowEventPublisher("tickets", batcher).notify(WorkflowEvent.NODE_EXECUTE, Node("n"))
+        BatchingWorkflowEventPublisher("audit", batcher).notify(WorkflowEvent.NODE_EXECUTE, Node("m"))
+        batcher.shutdown()
+        assert_that([(exchange, routing_key, len(simplejson.loads(body)))
+                     for exchange, routing_key, body in self.broker.published],
+                    equal_to([("tickets", "workflow_ticketing", 1), ("audit", "workflow_ticketing", 1)]))
+
+    def test_flushes_on_the_time_threshold(self):
+        batcher = EventBatcher(connection_factory=self.broker, batch_size=1000, flush_interval=0.01)
+        publisher = BatchingWorkflowEventPublisher("workflow_ticketing", batcher)
+        publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("n"))
+        publisher.flush()
+        assert_that(self.published_events(), has_length(1))
+        batcher.shutdown()
+
+    def test_drops_batches_that_fail_to_publish_and_reconnects(self):
+        self.broker.failures = 1
+        batcher = EventBatcher(connection_factory=self.broker, batch_size=1000, flush_interval=0.01)
+        publisher = BatchingWorkflowEventPublisher("workflow_ticketing", batcher)
+        publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("lost"))
+        publisher.flush()
+        publisher.notify(WorkflowEvent.NODE_EXECUTE, Node("n"))
+        publisher.flush()
+        assert_that([e['data'] for e in self.published_events()], equal_to(['n']))
+        batcher.shutdown()
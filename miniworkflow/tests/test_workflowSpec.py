@@ -0,0 +1,65 @@
+import pickle
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, same_instance
+from miniworkflow import Node, Transition, AndActivationPolicy, WorkflowSpec, WorkflowFactory, MiniWorkflow
+
+
+class TestWorkflowSpec(TestCase):
+    def build_diamond(self):
+        start = Node("start")
+        left = Node("left")
+        right = Node("right")
+        join = Node("join", activation_policy=AndActivationPolicy())
+        start.connect(Transition(left))
+        start.connect(Transition(right))
+        left.connect(Transition(join))
+        right.connect(Transition(join))
+        return start
+
+    def test_indexes_nodes_by_uuid_and_integer_id(self):
+        spec = WorkflowSpec(self.build_diamond())
+        assert_that(len(spec), equal_to(4))
+        for uuid, node in spec.nodes.items():
+            assert_that(spec.node_by_id(spec.node_id(uuid)), same_instance(node))
+
+    def test_adjacency_and_in_degree_tables(self):
+        spec = WorkflowSpec(self.build_diamond())
+        join = spec.node_id("join")
+        assert_that(spec.in_degree[join], equal_to(2))
+        assert_that(sorted(spec.predecessors[join]), equal_to(sorted([spec.node_id("left"), spec.node_id("right")])))
+        assert_that(spec.successors[spec.node_id("start")],
+                    equal_to((spec.node_id("left"), spec.node_id("right"))))
+
+    def test_factory_instances_share_one_spec(self):
+        factory = WorkflowFactory(self.build_diamond())
+        w1 = factory.create_instance()
+        w2 = factory.create_instance()
+        assert_that(w1.spec, same_instance(w2.spec))
+        assert_that(w1.nodes, same_instance(w2.nodes))
+
+    def test_nodes_and_transitions_carry_no_attribute_dict(self):
+        start = self.build_diamond()
+        assert_that(hasattr(start, '__dict__'), equal_to(False))
+        assert_that(hasattr(start.out_transitions[0], '__dict__'), equal_to(False))
+        self.assertRaises(AttributeError, setattr, start, 'color', 'red')
+
+    def test_nodes_and_transitions_pickle_with_every_protocol(self):
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            start = pickle.loads(pickle.dumps(self.build_diamond(), protocol))
+            join = start.out_transitions[0].target_node.out_transitions[0].target_node
+            assert_that(join.uuid(), equal_to("join"))
+            assert_that(join.in_transitions[1].source_node.uuid(), equal_to("right"))
+            assert_that(isinstance(join.activation_policy, AndActivationPolicy), equal_to(True))
+            assert_that(len(WorkflowSpec(start)), equal_to(4))
+
+    def test_compiles_chains_deeper_than_the_recursion_limit(self):
+        start = node = Node("n0")
+        for i in range(1, 5000):
+            node.connect(Transition(Node("n%d" % i)))
+            node = node.out_transitions[0].target_node
+        spec = WorkflowSpec(start)
+        assert_that(len(spec), equal_to(5000))
+        assert_that(spec.node_id("n4999"), equal_to(4999))
+        w = MiniWorkflow(start, spec=spec)
+        w.run()
+        assert_that(w.executed_trace[-1], equal_to("n4999"))
@@ -0,0 +1,65 @@
+from unittest import TestCase
+from hamcrest import assert_that, equal_to, is_not, same_instance
+from miniworkflow import WorkflowVariables, WorkflowEvent, StateChange, MiniWorkflow, Node, Transition
+from miniworkflow.tests.test_doubles.external_process_double import ExternalProcessDouble
+
+
+class RecordingObserver(object):
+    def __init__(self):
+        self.deltas = []
+
+    def notify(self, event, data):
+        self.deltas.append(data)
+
+
+class TestWorkflowVariables(TestCase):
+    def test_snapshots_are_shared_until_the_next_update(self):
+        variables = WorkflowVariables({'foo': {'bar': True}})
+        snapshot = variables.snapshot()
+        assert_that(variables.snapshot(), same_instance(snapshot))
+        variables._update({'baz': 1})
+        assert_that(snapshot, equal_to({'foo': {'bar': True}}))
+        assert_that(variables['foo'], same_instance(snapshot['foo']))
+        assert_that(variables.snapshot(), is_not(same_instance(snapshot)))
+
+    def test_updates_are_copied_in(self):
+        nested = {'bar': True}
+        variables = WorkflowVariables()
+        variables._update({'foo': nested})
+        nested['bar'] = False
+        assert_that(variables['foo'], equal_to({'bar': True}))
+
+    def test_tracks_the_delta_since_last_drain(self):
+        variables = WorkflowVariables({'foo': 1})
+        variables._update({'bar': 2})
+        variables._update({'baz': 3})
+        assert_that(variables.drain_delta(), equal_to({'bar': 2, 'baz': 3}))
+        assert_that(variables.drain_delta(), equal_to({}))
+        assert_that(variables.changes({'foo': 1, 'bar': 5}), equal_to({'bar': 5}))
+
+    def test_has_no_public_write_path(self):
+        assert_that(hasattr(WorkflowVariables(), 'update'), equal_to(False))
+
+
+class TestWorkflowVariableChanges(TestCase):
+    def setUp(self):
+        self.external_process = ExternalProcessDouble()
+        start = Node("start")
+        task = Node("task")
+        task.set_decomposition_factory(self.external_process)
+        start.connect(Transition(task))
+        self.w = MiniWorkflow(start, workflow_variables={'foo': 1})
+        self.observer = RecordingObserver()
+        self.w.observer.subscribe(WorkflowEvent.VARIABLES_CHANGED, self.observer)
+
+    def test_only_changed_entries_are_journaled(self):
+        self.w.journal = []
+        self.external_process.response = {'foo': 1, 'bar': 2}
+        self.w.run()
+        assert_that([record for record in self.w.journal if record[0] == StateChange.VARIABLES],
+                     equal_to([[StateChange.VARIABLES, {'bar': 2}]]))
+
+    def test_observers_get_the_delta_of_each_step(self):
+        self.external_process.response = {'foo': 1, 'bar': 2}
+        self.w.run()
+        assert_that(self.observer.deltas, equal_to([{'bar': 2}]))
@@ -0,0 +1,64 @@
+import heapq
+import time
+
+
+class TimerQueue(object):
+    """
+    Deadline-ordered heap of the timers of every workflow in a store, so
+    EventProcessor.fire_timers only touches the workflows whose deadline has
+    passed: O(expired log n) instead of a sweep over all instances.
+    Re-tracking a workflow replaces its timers; entries that were cancelled
+    or rescheduled meanwhile are skipped when they surface.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.__heap = []
+        self.__tracked = {}
+
+    def track(self, workflow_id, timers):
+        """
+        Record the current {(kind, node uuid): deadline} timers of a workflow
+        """
+        previous = self.__tracked.get(workflow_id, {})
+        for key, deadline in timers.iteritems():
+            if previous.get(key) != deadline:
+                heapq.heappush(self.__heap, (deadline, workflow_id, key))
+        if timers:
+            self.__tracked[workflow_id] = dict(timers)
+        else:
+            self.__tracked.pop(workflow_id, None)
+
+    def pop_due(self, now=None):
+        """
+        Ids of the workflows with a timer due at `now`, earliest first
+        """
+        if now is None:
+            now = self.clock()
+        due = []
+        seen = set()
+        while self.__heap and self.__heap[0][0] <= now:
+            deadline, workflow_id, key = heapq.heappop(self.__heap)
+            if self.__tracked.get(workflow_id, {}).get(key) == deadline and workflow_id not in seen:
+                seen.add(workflow_id)
+                due.append(workflow_id)
+        return due
+
+    def retry(self, workflow_id):
+        """
+        Queue the tracked timers of a workflow returned by pop_due again,
+        after acting on them failed
+        """
+        for key, deadline in self.__tracked.get(workflow_id, {}).iteritems():
+            heapq.heappush(self.__heap, (deadline, workflow_id, key))
+
+    def next_deadline(self):
+        while self.__heap:
+            deadline, workflow_id, key = self.__heap[0]
+            if self.__tracked.get(workflow_id, {}).get(key) == deadline:
+                return deadline
+            heapq.heappop(self.__heap)
+        return None
+
+    def __len__(self):
+        return sum(len(timers) for timers in self.__tracked.itervalues())